@@ -0,0 +1,325 @@
+"""
+Searchable SQLite index of generated images with prompts, parameters, edits and thumbnails
+
+Usage:
+    python asset_library.py index [directory]
+    python asset_library.py search treasure chest [--limit 20]
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+
+from asset_metadata import read_metadata
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    file_size INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    mode TEXT,
+    prompt TEXT NOT NULL DEFAULT '',
+    template TEXT NOT NULL DEFAULT '',
+    params TEXT NOT NULL DEFAULT '{}',
+    edits TEXT NOT NULL DEFAULT '[]',
+    created REAL NOT NULL,
+    thumbnail BLOB
+);
+CREATE INDEX IF NOT EXISTS assets_content_hash ON assets(content_hash);
+CREATE INDEX IF NOT EXISTS assets_created ON assets(created);
+"""
+
+
+def describe_edits(edits):
+    """Searchable text for an edit chain, e.g. "remove_background pixelate" """
+    return " ".join(str(edit.get("op", "")) for edit in edits if isinstance(edit, dict))
+
+
+class AssetLibrary:
+    """Index of the images under `root`, kept in `root`/.library.sqlite3.
+
+    index_directory() walks the tree and only reads files whose size or
+    modification time changed since the last scan, so after the first run
+    a rescan costs one stat per file. Each indexed file stores its content
+    hash, the metadata embedded when it was saved (prompt, template,
+    generation parameters, edit chain) and a small PNG thumbnail. Files that
+    can't be read as images are stored as stat-only rows with an empty
+    content hash, so they aren't re-read until they change, and are left out
+    of counts and searches. Searches go through an FTS5 index where SQLite
+    provides one, and a LIKE scan otherwise. Safe to use from several threads.
+    """
+
+    thumbnail_size = 96
+    batch_size = 200  # files written per transaction while scanning
+
+    def __init__(self, root="generated_images", db_path=None):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self.db_path = db_path or os.path.join(self.root, ".library.sqlite3")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        try:
+            self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS assets_fts "
+                             "USING fts5(prompt, template, edits, name)")
+            self.full_text = True
+        except sqlite3.OperationalError:
+            self.full_text = False  # SQLite built without FTS5
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM assets WHERE content_hash != ''").fetchone()[0]
+
+    def index_directory(self, directory=None, on_progress=None):
+        """Bring the index up to date with the image files under directory.
+
+        Returns (indexed, removed): files read because they were new or
+        changed, and entries dropped because their file is gone.
+        on_progress(indexed) is called after each committed batch.
+        """
+        directory = os.path.abspath(directory or self.root)
+        prefix = os.path.join(directory, "")
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in
+                     self._db.execute("SELECT path, mtime_ns, file_size FROM assets")
+                     if row[0].startswith(prefix)}
+
+        seen = set()
+        pending = []
+        indexed = 0
+        for path, stat in _walk(directory):
+            seen.add(path)
+            if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            record = _read_asset(path, stat, self.thumbnail_size)
+            pending.append(record if record is not None else _unreadable(path, stat))
+            if len(pending) >= self.batch_size:
+                self._store(pending)
+                indexed += len(pending)
+                pending = []
+                if on_progress:
+                    on_progress(indexed)
+        if pending:
+            self._store(pending)
+            indexed += len(pending)
+
+        removed = [path for path in known if path not in seen]
+        if removed:
+            with self._lock, self._db:
+                for path in removed:
+                    self._delete(path)
+        return indexed, len(removed)
+
+    def index_file(self, path, metadata=None):
+        """Index (or re-index) one file; metadata fills in what the file doesn't embed"""
+        path = os.path.abspath(path)
+        record = _read_asset(path, os.stat(path), self.thumbnail_size, metadata)
+        if record is not None:
+            self._store([record])
+        return record is not None
+
+    def _store(self, records):
+        with self._lock, self._db:
+            for record in records:
+                self._db.execute(
+                    "INSERT INTO assets (path, mtime_ns, file_size, content_hash, width, height, mode, "
+                    "prompt, template, params, edits, created, thumbnail) "
+                    "VALUES (:path, :mtime_ns, :file_size, :content_hash, :width, :height, :mode, "
+                    ":prompt, :template, :params, :edits, :created, :thumbnail) "
+                    "ON CONFLICT(path) DO UPDATE SET mtime_ns=excluded.mtime_ns, file_size=excluded.file_size, "
+                    "content_hash=excluded.content_hash, width=excluded.width, height=excluded.height, "
+                    "mode=excluded.mode, prompt=excluded.prompt, template=excluded.template, "
+                    "params=excluded.params, edits=excluded.edits, created=excluded.created, "
+                    "thumbnail=excluded.thumbnail", record)
+                if self.full_text:
+                    asset_id = self._db.execute("SELECT id FROM assets WHERE path = ?",
+                                                (record["path"],)).fetchone()[0]
+                    self._db.execute("DELETE FROM assets_fts WHERE rowid = ?", (asset_id,))
+                    if not record["content_hash"]:
+                        continue  # unreadable file, nothing to search
+                    self._db.execute(
+                        "INSERT INTO assets_fts (rowid, prompt, template, edits, name) VALUES (?, ?, ?, ?, ?)",
+                        (asset_id, record["prompt"], record["template"],
+                         describe_edits(json.loads(record["edits"])), os.path.basename(record["path"])))
+
+    def _delete(self, path):
+        row = self._db.execute("SELECT id FROM assets WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return
+        if self.full_text:
+            self._db.execute("DELETE FROM assets_fts WHERE rowid = ?", (row[0],))
+        self._db.execute("DELETE FROM assets WHERE id = ?", (row[0],))
+
+    def search(self, text="", limit=200):
+        """Newest assets whose prompt, template, edits or file name match every word of text"""
+        words = [word for word in text.split() if word]
+        columns = ("a.id, a.path, a.content_hash, a.width, a.height, a.mode, a.prompt, a.template, "
+                   "a.params, a.edits, a.created, a.thumbnail")
+        if not words:
+            sql = f"SELECT {columns} FROM assets a WHERE a.content_hash != '' ORDER BY a.created DESC LIMIT ?"
+            args = [limit]
+        elif self.full_text:
+            # Each word as a quoted prefix term, so "trea ches" finds "treasure chest"
+            query = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+            sql = (f"SELECT {columns} FROM assets_fts f JOIN assets a ON a.id = f.rowid "
+                   f"WHERE assets_fts MATCH ? ORDER BY a.created DESC LIMIT ?")
+            args = [query, limit]
+        else:
+            clause = " AND ".join("(a.prompt || ' ' || a.template || ' ' || a.edits || ' ' || a.path) LIKE ?"
+                                  for _ in words)
+            sql = (f"SELECT {columns} FROM assets a WHERE a.content_hash != '' AND {clause} "
+                   f"ORDER BY a.created DESC LIMIT ?")
+            args = [f"%{word}%" for word in words] + [limit]
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [_asset(row) for row in rows]
+
+    def find_by_hash(self, content_hash):
+        """Paths of every indexed file with exactly this content"""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT path FROM assets WHERE content_hash = ? ORDER BY created", (content_hash,))]
+
+    @staticmethod
+    def thumbnail(asset):
+        """The stored thumbnail of a search result as a PIL image, or None"""
+        if not asset.get("thumbnail"):
+            return None
+        return Image.open(io.BytesIO(asset["thumbnail"]))
+
+
+def _walk(directory):
+    """Yield (path, stat) for image files under directory, skipping hidden entries"""
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue  # .cache, the library database, ...
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.abspath(entry.path), entry.stat()
+        except OSError:
+            continue
+
+
+def _read_asset(path, stat, thumbnail_size, metadata=None):
+    """Hash, inspect and thumbnail one file; None if it isn't a readable image"""
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+        with Image.open(io.BytesIO(data)) as image:
+            embedded = read_metadata(image)
+            size, mode = image.size, image.mode
+            image.draft("RGB", (thumbnail_size, thumbnail_size))  # JPEG decodes at reduced scale
+            thumb = image if image.mode in ("RGB", "RGBA", "L") else image.convert("RGBA")
+            thumb = thumb.copy()
+        thumb.thumbnail((thumbnail_size, thumbnail_size), Image.BOX)
+        buffer = io.BytesIO()
+        thumb.save(buffer, format="PNG")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    info = dict(metadata or {})
+    info.update(embedded)
+    params = info.get("params") if isinstance(info.get("params"), dict) else {}
+    edits = info.get("edits") if isinstance(info.get("edits"), list) else []
+    return {
+        "path": path,
+        "mtime_ns": stat.st_mtime_ns,
+        "file_size": stat.st_size,
+        "content_hash": hashlib.sha256(data).hexdigest(),
+        "width": size[0],
+        "height": size[1],
+        "mode": mode,
+        "prompt": str(info.get("prompt") or ""),
+        "template": str(info.get("template") or ""),
+        "params": json.dumps(params, sort_keys=True),
+        "edits": json.dumps(edits),
+        "created": float(info.get("created") or stat.st_mtime),
+        "thumbnail": buffer.getvalue(),
+    }
+
+
+def _unreadable(path, stat):
+    """Stat-only record for a file that isn't a readable image"""
+    return {
+        "path": path,
+        "mtime_ns": stat.st_mtime_ns,
+        "file_size": stat.st_size,
+        "content_hash": "",
+        "width": None,
+        "height": None,
+        "mode": None,
+        "prompt": "",
+        "template": "",
+        "params": "{}",
+        "edits": "[]",
+        "created": stat.st_mtime,
+        "thumbnail": None,
+    }
+
+
+def _asset(row):
+    asset = dict(row)
+    asset["params"] = json.loads(asset["params"])
+    asset["edits"] = json.loads(asset["edits"])
+    return asset
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index and search generated images")
+    parser.add_argument("--root", default="generated_images", help="library root (holds the database)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index = commands.add_parser("index", help="bring the index up to date")
+    index.add_argument("directory", nargs="?", help="directory to scan (default: the root)")
+    search = commands.add_parser("search", help="find assets by prompt, template, edits or file name")
+    search.add_argument("words", nargs="*")
+    search.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    library = AssetLibrary(args.root)
+    if args.command == "index":
+        started = time.perf_counter()
+        indexed, removed = library.index_directory(
+            args.directory, on_progress=lambda n: print(f"  {n} files indexed...", flush=True))
+        print(f"Indexed {indexed} new or changed file(s), removed {removed}; "
+              f"{library.count()} assets in {time.perf_counter() - started:.2f}s")
+    else:
+        started = time.perf_counter()
+        assets = library.search(" ".join(args.words), args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        for asset in assets:
+            edits = describe_edits(asset["edits"])
+            print(f"{asset['path']}  {asset['width']}x{asset['height']}  {asset['prompt']!r}"
+                  + (f"  [{edits}]" if edits else ""))
+        print(f"{len(assets)} result(s) in {elapsed:.1f} ms")
+    library.close()
+
+
+if __name__ == "__main__":
+    main()
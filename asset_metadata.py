@@ -0,0 +1,20 @@
+"""
+Asset metadata embedded in saved images (prompt, template, parameters, edits)
+"""
+
+import json
+
+# PNG text chunk holding an asset's JSON metadata, so rescans can recover it
+METADATA_KEY = "pixel_asset"
+
+
+def read_metadata(image):
+    """The asset metadata embedded in an opened image, or {}"""
+    raw = image.info.get(METADATA_KEY)
+    if not raw:
+        return {}
+    try:
+        metadata = json.loads(raw)
+    except (TypeError, ValueError):
+        return {}
+    return metadata if isinstance(metadata, dict) else {}
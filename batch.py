@@ -0,0 +1,243 @@
+"""
+Headless batch generation driven by a JSONL file of prompts
+
+Each input line is a JSON object:
+    {"prompt": "treasure chest", "id": "chest", "template": "...{prompt}...",
+     "template_file": "prompt_template.txt", "size": "1024x1024",
+     "pixel_size": 8, "remove_bg": true, "bg_quality": "fast", "palette": "pico-8"}
+Only "prompt" is required; everything else falls back to the command-line
+defaults. With "palette": "adaptive" the palette fitted to the first
+finished image is reused for the rest of the run so the sprite set shares
+its colours. Results are written to the output directory together with a
+manifest.jsonl, and lines already recorded as "ok" in the manifest are
+skipped on the next run so an interrupted batch can simply be restarted.
+
+Usage:
+    python batch.py prompts.jsonl [--parallel 4] [--output-dir generated_images/batch]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from asset_library import AssetLibrary
+from image_generator import ImageGenerator
+from image_processor import ImageProcessor
+from instrumentation import tracer
+from process_pool import DEFAULT_PROCESSES, ImageWorkerPool
+
+
+def load_template(path):
+    """Read a prompt template, falling back to the bare prompt"""
+    try:
+        with open(path, 'r') as file:
+            template_text = file.read().strip()
+            if template_text:
+                return template_text
+    except OSError:
+        pass
+    return "{prompt}"
+
+
+def read_requests(path):
+    """Yield (line_id, request) for each non-blank line of a JSONL file"""
+    seen = set()
+    with open(path, 'r', encoding='utf-8') as file:
+        for lineno, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{lineno}: invalid JSON: {e}")
+            if not isinstance(request, dict) or not request.get("prompt"):
+                raise ValueError(f"{path}:{lineno}: each line needs a \"prompt\"")
+            line_id = str(request.get("id", f"line-{lineno}"))
+            if line_id in seen:
+                # Both would write the same output and share one manifest record
+                raise ValueError(f"{path}:{lineno}: duplicate id {line_id!r}")
+            seen.add(line_id)
+            yield line_id, request
+
+
+def completed_ids(manifest_path):
+    """Ids recorded as successfully completed by a previous run"""
+    done = set()
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partial line from a crash mid-write
+            if entry.get("status") == "ok":
+                done.add(entry.get("id"))
+    return done
+
+
+def output_filename(line_id):
+    """File name for an id; ids that need sanitising get a hash suffix so "a b" and "a_b" differ"""
+    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", line_id)
+    if safe != line_id:
+        safe += "-" + hashlib.sha1(line_id.encode("utf-8")).hexdigest()[:8]
+    return safe + ".png"
+
+
+class BatchRunner:
+    """Generates and post-processes batch requests, recording each in the manifest"""
+
+    def __init__(self, generator, output_dir, defaults, workers=None):
+        self.generator = generator
+        # Background removal and quantize run here; threads share its processes
+        self.workers = workers or ImageWorkerPool(processes=0)
+        self.output_dir = output_dir
+        self.defaults = defaults
+        self.manifest_path = os.path.join(output_dir, "manifest.jsonl")
+        self._manifest_lock = threading.Lock()
+        self._templates = {}
+        self._palette_lock = threading.Lock()
+        self._shared_palette = None
+
+    def _template(self, request):
+        if request.get("template"):
+            return request["template"]
+        path = request.get("template_file", self.defaults["template_file"])
+        if path not in self._templates:
+            self._templates[path] = load_template(path)
+        return self._templates[path]
+
+    def _palette(self, palette, image):
+        if palette != "adaptive":
+            return palette
+        with self._palette_lock:
+            if self._shared_palette is None:
+                self._shared_palette = ImageProcessor.adaptive_palette([image], self.defaults["colors"])
+            return self._shared_palette
+
+    def _record(self, entry):
+        with self._manifest_lock:
+            with open(self.manifest_path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+    def run_one(self, line_id, request):
+        """Generate, post-process and save one request; returns its manifest entry"""
+        started = time.monotonic()
+        entry = {"id": line_id, "prompt": request["prompt"]}
+        try:
+            # A bad field fails this item only, like any other error below
+            size = request.get("size", self.defaults["size"])
+            pixel_size = int(request.get("pixel_size", self.defaults["pixel_size"]))
+            remove_bg = bool(request.get("remove_bg", self.defaults["remove_bg"]))
+            bg_quality = request.get("bg_quality", self.defaults["bg_quality"])
+            palette = request.get("palette", self.defaults["palette"])
+            prompt = self._template(request).replace("{prompt}", request["prompt"])
+            entry.update(
+                final_prompt=prompt,
+                size=size,
+                pixel_size=pixel_size,
+                remove_bg=remove_bg,
+                bg_quality=bg_quality,
+                palette=palette,
+            )
+            # Embedded in the PNG so the asset library can index it
+            metadata = {
+                "prompt": request["prompt"],
+                "template": self._template(request),
+                "params": {"size": size, "model": self.generator.model, "quality": self.generator.quality,
+                           "batch_id": line_id},
+                "edits": [],
+            }
+            image = self.generator.generate_image(prompt, size, force_refresh=self.defaults["force_refresh"])
+            if remove_bg:
+                image = self.workers.run("remove_background", image, quality=bg_quality)
+                metadata["edits"].append({"op": "remove_background", "quality": bg_quality})
+            if pixel_size > 1:
+                image = ImageProcessor.pixelate(image, pixel_size=pixel_size)
+                metadata["edits"].append({"op": "pixelate", "pixel_size": pixel_size})
+            if palette:
+                image = self.workers.run("quantize", image, palette=self._palette(palette, image))
+                metadata["edits"].append({"op": "quantize", "palette": palette})
+            output = os.path.join(self.output_dir, output_filename(line_id))
+            metadata["created"] = time.time()
+            if not ImageProcessor.save_image(image, output, metadata):
+                raise Exception(f"Could not write {output}")
+            entry.update(status="ok", output=output)
+        except Exception as e:
+            entry.update(status="failed", error=str(e))
+        entry["seconds"] = round(time.monotonic() - started, 3)
+        self._record(entry)
+        return entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate images headlessly from a JSONL file of prompts")
+    parser.add_argument("input", help="JSONL file with one request per line")
+    parser.add_argument("--output-dir", default=os.path.join("generated_images", "batch"))
+    parser.add_argument("--parallel", type=int, default=4, help="number of requests processed at once")
+    parser.add_argument("--template-file", default="prompt_template.txt")
+    parser.add_argument("--size", default="1024x1024")
+    parser.add_argument("--pixel-size", type=int, default=0, help="pixelate after generation (0 = off)")
+    parser.add_argument("--remove-bg", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--bg-quality", choices=ImageProcessor.BG_QUALITY_MODES, default="fast")
+    parser.add_argument("--palette", default=None, help="palette name (pico-8, nes, game-boy) or 'adaptive'")
+    parser.add_argument("--colors", type=int, default=16, help="colours in an adaptive palette")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES,
+                        help=f"worker processes for background removal and quantize "
+                             f"(default: {DEFAULT_PROCESSES}, 0 = in-process)")
+    parser.add_argument("--force-refresh", action="store_true", help="bypass the image cache")
+    parser.add_argument("--index", action=argparse.BooleanOptionalAction, default=True,
+                        help="add the results to the asset library in generated_images")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    tracer.enable(os.getenv("LATENCY_LOG"))  # only when asked for, unlike the GUI
+    runner = BatchRunner(ImageGenerator(), args.output_dir, {
+        "template_file": args.template_file,
+        "size": args.size,
+        "pixel_size": args.pixel_size,
+        "remove_bg": args.remove_bg,
+        "bg_quality": args.bg_quality,
+        "palette": args.palette,
+        "colors": args.colors,
+        "force_refresh": args.force_refresh,
+    }, workers=ImageWorkerPool(processes=args.processes, warm_up=args.remove_bg))
+
+    done = completed_ids(runner.manifest_path)
+    pending = [(line_id, request) for line_id, request in read_requests(args.input) if line_id not in done]
+    print(f"{len(pending)} request(s) to run, {len(done)} already complete")
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as executor:
+        futures = [executor.submit(runner.run_one, line_id, request) for line_id, request in pending]
+        for future in as_completed(futures):
+            entry = future.result()
+            if entry["status"] == "ok":
+                print(f"✓ {entry['id']} -> {entry['output']} ({entry['seconds']}s)")
+            else:
+                failures += 1
+                print(f"✗ {entry['id']}: {entry['error']}")
+    runner.workers.shutdown()
+
+    print(f"Done: {len(pending) - failures} succeeded, {failures} failed")
+    stats = runner.generator.resilience_stats()
+    print("API: " + ", ".join(f"{key} {value}" for key, value in sorted(stats.items())))
+    if args.index:
+        library = AssetLibrary()
+        indexed, _ = library.index_directory(args.output_dir)
+        library.close()
+        print(f"Asset library: {indexed} file(s) indexed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
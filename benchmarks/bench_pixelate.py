@@ -0,0 +1,69 @@
+"""
+Benchmark block-average pixelate against the previous nearest-sample version
+
+Usage:
+    python benchmarks/bench_pixelate.py [--sizes 512 1024 2048 4096] [--pixel-sizes 4 12] [--runs 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from image_processor import ImageProcessor
+
+
+def legacy_pixelate(image, pixel_size=8):
+    """The previous implementation: one nearest sample per block, two resamples"""
+    original_size = image.size
+    small_size = (original_size[0] // pixel_size, original_size[1] // pixel_size)
+    small_image = image.resize(small_size, Image.NEAREST)
+    return small_image.resize(original_size, Image.NEAREST)
+
+
+def make_fixture(size, mode):
+    """Photo-like noise with a transparent border when the mode has alpha"""
+    rng = np.random.default_rng(size)
+    pixels = rng.integers(0, 256, (size, size, len(mode)), dtype=np.uint8)
+    if mode == "RGBA":
+        pixels[:, :, 3] = 255
+        pixels[: size // 8, :, 3] = 0
+    return Image.fromarray(pixels, mode)
+
+
+def median_ms(fn, runs):
+    fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048, 4096])
+    parser.add_argument("--pixel-sizes", type=int, nargs="+", default=[4, 12])
+    parser.add_argument("--modes", nargs="+", default=["RGB", "RGBA"])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':<5} {'size':>5} {'px':>3} {'nearest ms':>11} {'average ms':>11} {'ratio':>6}")
+    for mode in args.modes:
+        for size in args.sizes:
+            image = make_fixture(size, mode)
+            for pixel_size in args.pixel_sizes:
+                legacy = median_ms(lambda: legacy_pixelate(image, pixel_size), args.runs)
+                current = median_ms(lambda: ImageProcessor.pixelate(image, pixel_size), args.runs)
+                print(f"{mode:<5} {size:>5} {pixel_size:>3} {legacy:>11.1f} {current:>11.1f} {current / legacy:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark cold start: time until the main window's first frame is drawn
+
+Each run launches main.py in a fresh interpreter with APP_STARTUP_BENCHMARK
+set; the app prints first_frame_ms as soon as the window is drawn and then
+closes itself. Needs a display. --imports-only times `import main` instead,
+which works headless and tracks the import share of startup.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--imports-only]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def launch(args, env):
+    """Run one fresh interpreter; return (wall ms until exit, first_frame_ms printed or None)"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    wall = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "launch failed")
+    reported = None
+    for line in result.stdout.splitlines():
+        if line.startswith("first_frame_ms="):
+            reported = float(line.split("=", 1)[1])
+    return wall, reported
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--imports-only", action="store_true", help="time `import main` (no display needed)")
+    args = parser.parse_args()
+
+    env = dict(os.environ, APP_STARTUP_BENCHMARK="1")
+    baseline = [launch(["-c", "pass"], env)[0] for _ in range(args.runs)]
+    print(f"interpreter alone: {median(baseline):.0f} ms")
+
+    if args.imports_only:
+        walls = [launch(["-c", "import main"], env)[0] for _ in range(args.runs)]
+        print(f"import main:       {median(walls):.0f} ms wall (min {min(walls):.0f})")
+        return
+
+    walls, frames = [], []
+    for _ in range(args.runs):
+        wall, reported = launch(["main.py"], env)
+        walls.append(wall)
+        if reported is not None:
+            frames.append(reported)
+    if frames:
+        print(f"first frame:       {median(frames):.0f} ms after main.py started (min {min(frames):.0f})")
+    print(f"launch to exit:    {median(walls):.0f} ms wall (min {min(walls):.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Benchmark suite for ImageProcessor operations and the generation pipeline
+
+Runs every operation over synthetic pixel-art and photo-like fixtures in
+RGB, RGBA and P mode at several sizes and reports latency percentiles,
+throughput and peak memory. An end-to-end scenario pushes prompts through
+ImageGenerator (with a stubbed API client) and the batch post-processing.
+Results are written as JSON with stable keys so two runs can be compared:
+
+Usage:
+    python benchmarks/bench_suite.py [--sizes 256 1024 2048] [--runs 7] [--output results.json]
+    python benchmarks/bench_suite.py --compare old.json new.json
+
+remove_background uses a stub segmentation session unless --real-model is
+given, so by default it measures everything around the model. Peak memory
+is what tracemalloc sees (Python and numpy allocations; Pillow's own image
+buffers are not traced).
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import PIL
+from PIL import Image, ImageDraw
+
+from image_processor import ImageProcessor
+from bench_remove_background import StubSession
+
+
+def pixel_art_fixture(size, mode):
+    """Flat-colour sprite on a transparent (or white) background, upscaled blocks"""
+    block = max(1, size // 32)
+    small = Image.new("RGBA", (size // block, size // block), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(small)
+    s = small.width
+    draw.rectangle((s // 4, s // 4, 3 * s // 4, 3 * s // 4), fill=(200, 40, 40, 255))
+    draw.rectangle((s // 3, s // 3, s // 2, s // 2), fill=(250, 220, 60, 255))
+    draw.ellipse((s // 2, s // 5, 4 * s // 5, s // 2), fill=(40, 120, 220, 255))
+    image = small.resize((size, size), Image.NEAREST)
+    return _to_mode(image, mode)
+
+
+def photo_fixture(size, mode):
+    """Smooth gradients with noise, the worst case for palette and compression work"""
+    rng = np.random.default_rng(size)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    rgb = np.stack([x * 255, y * 255, (1 - x) * y * 255], axis=2)
+    rgb += rng.normal(0, 12, rgb.shape)
+    alpha = np.where((x - 0.5) ** 2 + (y - 0.5) ** 2 < 0.16, 255, 0)[:, :, None]
+    pixels = np.concatenate([rgb, alpha], axis=2)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGBA")
+    return _to_mode(image, mode)
+
+
+def _to_mode(image, mode):
+    if mode == "RGBA":
+        return image
+    if mode == "RGB":
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return ImageProcessor.quantize(image, "pico-8")  # "P" with a transparent index
+
+
+FIXTURES = {"pixel-art": pixel_art_fixture, "photo": photo_fixture}
+
+
+def operations(real_model):
+    session = None if real_model else StubSession()
+    return {
+        "pixelate": lambda image: ImageProcessor.pixelate(image, 8),
+        "resize": lambda image: ImageProcessor.resize_image(image, (image.width // 2, image.height // 2),
+                                                            maintain_aspect=False),
+        "contrast": lambda image: ImageProcessor.adjust_contrast(image, 1.3),
+        "brightness": lambda image: ImageProcessor.adjust_brightness(image, 1.2),
+        "quantize": lambda image: ImageProcessor.quantize(image, "pico-8"),
+        "remove_background": lambda image: ImageProcessor.remove_background(image, session=session),
+    }
+
+
+def measure(fn, runs):
+    """Latency percentiles (ms) and traced peak memory (MB) over runs calls"""
+    fn()  # warm caches and lazy imports outside the measurement
+    timings = []
+    peak = 0
+    for _ in range(runs):
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    timings.sort()
+    return {
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "min_ms": round(timings[0], 3),
+        "peak_mb": round(peak / (1024 * 1024), 2),
+    }
+
+
+class StubImagesAPI:
+    """Stands in for client.images: returns a fixed PNG as b64_json after a delay"""
+
+    def __init__(self, png_bytes, latency):
+        self.payload = base64.b64encode(png_bytes).decode("ascii")
+        self.latency = latency
+
+    def generate(self, **params):
+        time.sleep(self.latency)
+        item = type("Item", (), {"b64_json": self.payload, "url": None})()
+        return type("Response", (), {"data": [item]})()
+
+
+def end_to_end(count, parallel, latency, real_model, size):
+    """Prompts through ImageGenerator and BatchRunner post-processing with a stub API"""
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "benchmark")
+    from batch import BatchRunner
+    from image_cache import ImageCache
+    from image_generator import ImageGenerator
+    from process_pool import ImageWorkerPool
+
+    buffer = io.BytesIO()
+    photo_fixture(size, "RGB").save(buffer, format="PNG")
+    with tempfile.TemporaryDirectory() as tmp:
+        generator = ImageGenerator(cache=ImageCache(os.path.join(tmp, "cache")))
+        generator.client = type("Client", (), {"images": StubImagesAPI(buffer.getvalue(), latency)})()
+        if not real_model:
+            original = ImageProcessor.remove_background
+            session = StubSession()
+            ImageProcessor.remove_background = staticmethod(
+                lambda image, quality="fast", **kwargs: original(image, session=session, quality=quality, **kwargs))
+        try:
+            runner = BatchRunner(generator, tmp, {
+                "template_file": "", "size": f"{size}x{size}", "pixel_size": 8, "remove_bg": True,
+                "bg_quality": "fast", "palette": "pico-8", "colors": 16, "force_refresh": True,
+            }, workers=ImageWorkerPool(processes=0))
+            requests = [(f"item-{i}", {"prompt": f"sprite {i}"}) for i in range(count)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                entries = list(executor.map(lambda item: runner.run_one(*item), requests))
+            wall = time.perf_counter() - start
+        finally:
+            if not real_model:
+                ImageProcessor.remove_background = original
+    failed = [e for e in entries if e["status"] != "ok"]
+    if failed:
+        raise RuntimeError(f"end-to-end run failed: {failed[0]['error']}")
+    latencies = sorted(e["seconds"] * 1000 for e in entries)
+    return {
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+        "images_per_s": round(count / wall, 3),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run(args):
+    results = {}
+    ops = operations(args.real_model)
+    for fixture_name, make in FIXTURES.items():
+        for mode in args.modes:
+            for size in args.sizes:
+                image = make(size, mode)
+                for op_name in args.ops:
+                    key = f"{op_name}|{fixture_name}|{mode}|{size}"
+                    stats = measure(lambda: ops[op_name](image), args.runs)
+                    stats["mpix_per_s"] = round(size * size / 1e6 / (stats["p50_ms"] / 1000), 2)
+                    results[key] = stats
+                    print(f"{key:<40} p50 {stats['p50_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms  "
+                          f"{stats['mpix_per_s']:>8.1f} MP/s  peak {stats['peak_mb']:>7.1f} MB")
+    if args.e2e:
+        stats = end_to_end(args.e2e, args.parallel, args.api_latency_ms / 1000, args.real_model, args.e2e_size)
+        key = f"end_to_end|photo|RGB|{args.e2e_size}"
+        results[key] = stats
+        print(f"{key:<40} p50 {stats['p50_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms  "
+              f"{stats['images_per_s']:>8.2f} img/s")
+    return {"environment": environment(), "settings": vars(args), "results": results}
+
+
+def compare(old_path, new_path):
+    """Print the p50 change of every result present in both runs"""
+    with open(old_path, encoding="utf-8") as file:
+        old = json.load(file)["results"]
+    with open(new_path, encoding="utf-8") as file:
+        new = json.load(file)["results"]
+    print(f"{'benchmark':<40} {'old p50':>10} {'new p50':>10} {'change':>8}")
+    for key in sorted(set(old) & set(new)):
+        before, after = old[key]["p50_ms"], new[key]["p50_ms"]
+        change = (after - before) / before * 100 if before else 0.0
+        flag = "  <-- slower" if change > 10 else ""
+        print(f"{key:<40} {before:>10.2f} {after:>10.2f} {change:>+7.1f}%{flag}")
+    for key in sorted(set(old) ^ set(new)):
+        print(f"{key:<40} only in {'old' if key in old else 'new'} run")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024, 2048])
+    parser.add_argument("--modes", nargs="+", default=["RGB", "RGBA", "P"])
+    parser.add_argument("--ops", nargs="+", default=list(operations(False)))
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--real-model", action="store_true", help="run the actual rembg model")
+    parser.add_argument("--e2e", type=int, default=16, help="images in the end-to-end scenario (0 = skip)")
+    parser.add_argument("--e2e-size", type=int, default=1024)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--api-latency-ms", type=float, default=0, help="simulated API response time")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="diff two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
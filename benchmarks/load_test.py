@@ -0,0 +1,193 @@
+"""
+Load-test ImageGenerator against the local fake images API
+
+Starts fake_image_api.FakeImageAPI in-process (or targets --endpoint) and
+pushes prompts through the real generator code paths: generate_image from a
+thread pool, or generate_batch with its token bucket and shared backoff.
+A share of the prompts repeats so the disk cache is exercised too. Reports
+throughput, client-side latency percentiles, failures and what the server
+saw (throttling, 5xx, downloads, peak concurrency) next to the generator's
+resilience counters (retries, timeouts, hedges, circuit breaker).
+
+Usage:
+    python benchmarks/load_test.py [--requests 100] [--concurrency 8] [--mode threads|batch]
+                                   [--latency-ms 500 --latency-dist lognormal] [--rate-429 0.05]
+                                   [--rate-5xx 0.02] [--response-format url] [--repeat 0.2]
+                                   [--rate-stall 0.02 --timeout 5 --hedge-after p95]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_image_api import FakeImageAPI, LatencyModel
+from image_cache import ImageCache
+from image_generator import ImageGenerator
+from resilience import parse_hedge_after
+
+
+def make_prompts(count, repeat, seed):
+    """count prompts of which about `repeat` are duplicates of earlier ones"""
+    rng = random.Random(seed)
+    prompts = []
+    for i in range(count):
+        if prompts and rng.random() < repeat:
+            prompts.append(rng.choice(prompts))
+        else:
+            prompts.append(f"pixel art sprite {i}")
+    return prompts
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def run_threads(generator, prompts, size, concurrency):
+    def one(prompt):
+        start = time.perf_counter()
+        try:
+            generator.generate_image(prompt, size)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, str(e)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(one, prompts))
+
+
+def run_batch(generator, prompts, size, concurrency, requests_per_minute, max_retries):
+    async def drive():
+        # Batch items all start together, so per-item latency includes queueing
+        # behind the semaphore and the token bucket, as a user would see it
+        start = time.perf_counter()
+        outcomes = []
+        async for result in generator.generate_batch(prompts, size, concurrency=concurrency,
+                                                     requests_per_minute=requests_per_minute,
+                                                     max_retries=max_retries):
+            outcomes.append((time.perf_counter() - start, result.error))
+        return outcomes
+
+    return asyncio.run(drive())
+
+
+def server_stats(api, endpoint):
+    if api is not None:
+        return api.stats()
+    try:
+        with urllib.request.urlopen(f"{endpoint.rstrip('/')}/stats", timeout=5) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--endpoint", help="use an already running server instead of starting one")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=("threads", "batch"), default="threads")
+    parser.add_argument("--size", default="1024x1024")
+    parser.add_argument("--repeat", type=float, default=0.2, help="fraction of prompts repeated (cache hits)")
+    parser.add_argument("--response-format", choices=("b64_json", "url"), default="b64_json")
+    parser.add_argument("--rpm", type=float, default=6000, help="client requests-per-minute budget (batch mode)")
+    parser.add_argument("--max-retries", type=int, default=3, help="retries per request")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per API attempt")
+    parser.add_argument("--deadline", type=float, default=None, help="seconds per image, retries included")
+    parser.add_argument("--hedge-after", default=None, help="seconds or 'p95' before a hedged duplicate (threads mode)")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--latency-dist", choices=LatencyModel.KINDS, default="lognormal")
+    parser.add_argument("--spread", type=float, default=0.5)
+    parser.add_argument("--download-latency-ms", type=float, default=20)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--server-rpm", type=int, default=None, help="quota enforced by the fake server")
+    parser.add_argument("--rate-stall", type=float, default=0.0, help="fraction of requests the server hangs on")
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    api = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        rng = random.Random(args.seed)
+        api = FakeImageAPI(latency=LatencyModel(args.latency_ms, args.latency_dist, args.spread, rng),
+                           download_latency=LatencyModel(args.download_latency_ms, args.latency_dist, args.spread, rng),
+                           rate_429=args.rate_429, rate_5xx=args.rate_5xx, retry_after=args.retry_after,
+                           requests_per_minute=args.server_rpm, seed=args.seed,
+                           rate_stall=args.rate_stall, stall_seconds=args.stall_seconds).start()
+        endpoint = api.endpoint
+
+    prompts = make_prompts(args.requests, args.repeat, args.seed)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            generator = ImageGenerator(cache=ImageCache(os.path.join(tmp, "cache")),
+                                       endpoint=endpoint, api_key="load-test")
+            generator.response_format = args.response_format
+            generator.resilience.max_retries = args.max_retries
+            if args.timeout is not None:
+                generator.request_timeout = args.timeout
+            if args.deadline is not None:
+                generator.deadline = args.deadline
+            if args.hedge_after is not None:
+                generator.resilience.hedge_after = parse_hedge_after(args.hedge_after)
+            start = time.perf_counter()
+            if args.mode == "threads":
+                outcomes = run_threads(generator, prompts, args.size, args.concurrency)
+            else:
+                outcomes = run_batch(generator, prompts, args.size, args.concurrency, args.rpm, args.max_retries)
+            wall = time.perf_counter() - start
+            cache = generator.cache.stats()
+            client = generator.resilience_stats()
+    finally:
+        stats = server_stats(api, endpoint)
+        if api is not None:
+            api.stop()
+
+    latencies = sorted(seconds * 1000 for seconds, error in outcomes if error is None)
+    errors = [error for _, error in outcomes if error is not None]
+    report = {
+        "mode": args.mode,
+        "requests": len(outcomes),
+        "ok": len(latencies),
+        "failed": len(errors),
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(latencies) / wall, 3) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "max_ms": round(latencies[-1], 1) if latencies else 0.0,
+        "server": stats,
+        "cache": cache,
+        "client": client,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return
+
+    print(f"{report['mode']}: {report['ok']}/{report['requests']} ok in {report['wall_s']:.2f}s "
+          f"({report['throughput_per_s']:.2f} images/s)")
+    print(f"latency p50 {report['p50_ms']:.0f} ms  p95 {report['p95_ms']:.0f} ms  "
+          f"p99 {report['p99_ms']:.0f} ms  max {report['max_ms']:.0f} ms")
+    if stats:
+        print("server  " + "  ".join(f"{key} {value}" for key, value in sorted(stats.items())))
+    if cache:
+        print("cache   " + "  ".join(f"{key} {value}" for key, value in sorted(cache.items())))
+    print("client  " + "  ".join(f"{key} {value}" for key, value in sorted(client.items())))
+    if errors:
+        print(f"first error: {errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Memoized fit-to-canvas previews for the image canvas
+"""
+
+from collections import OrderedDict
+
+from PIL import Image, ImageTk
+
+
+def fit_size(size, box):
+    """Largest size with the same aspect ratio that fits in box, never upscaling"""
+    width, height = size
+    scale = min(box[0] / width, box[1] / height, 1)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+class DisplayCache:
+    """Recently shown PhotoImages keyed by (source image, canvas box).
+
+    Each entry keeps a reference to its source image, so an identity key can
+    not be reused by a different image while the entry is alive. Together
+    with the edit graph handing back the same image object for a state it has
+    already rendered, stepping back and forth between recent states reuses
+    the PhotoImage instead of scaling and converting the image again.
+    """
+
+    def __init__(self, max_entries=12):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def photo(self, image, box):
+        """Return a PhotoImage of image scaled to fit box"""
+        key = (id(image), box)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is image:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        size = fit_size(image.size, box)
+        # NEAREST keeps the pixel-art edges crisp and only reads output pixels
+        preview = image if size == image.size else image.resize(size, Image.NEAREST)
+        photo = ImageTk.PhotoImage(preview)
+        self._entries[key] = (image, photo)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return photo
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,277 @@
+"""
+Non-destructive edit graph: edits are recorded as operations and rendered lazily
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EditOp:
+    """One recorded edit. Subclasses implement apply(image).
+
+    The output of an expensive operation is kept in the graph's render cache
+    so that undoing a later edit does not re-run it; this is safe because an
+    op only ever sits at one position in one chain, so its input never changes.
+    """
+
+    expensive = False
+
+    def __init__(self, name, **params):
+        self.name = name
+        self.params = params  # recorded with saved assets, e.g. {"pixel_size": 8}
+
+    def apply(self, image):
+        raise NotImplementedError
+
+    def describe(self):
+        """JSON-serialisable summary of the edit"""
+        return dict(self.params, op=self.name)
+
+
+class ImageOp(EditOp):
+    """Wraps an arbitrary image -> image function such as pixelate or resize"""
+
+    def __init__(self, name, fn, expensive=False, **params):
+        super().__init__(name, **params)
+        self.fn = fn
+        self.expensive = expensive
+
+    def apply(self, image):
+        return self.fn(image)
+
+
+class PointOp(EditOp):
+    """A per-channel tone curve that can be fused with neighbouring point ops"""
+
+    def curve(self, means):
+        """Return 256 float32 output levels given the input's per-band means"""
+        raise NotImplementedError
+
+    def apply(self, image):
+        return apply_point_ops(image, [self])
+
+
+class ContrastOp(PointOp):
+    """Same result as ImageEnhance.Contrast: blend towards the mean grey level"""
+
+    def __init__(self, factor):
+        super().__init__("contrast", factor=factor)
+        self.factor = factor
+
+    def curve(self, means):
+        if len(means) >= 3:
+            luma = means[0] * 0.299 + means[1] * 0.587 + means[2] * 0.114
+        else:
+            luma = means[0]
+        grey = np.float32(int(luma + 0.5))
+        levels = np.arange(256, dtype=np.float32)
+        return grey + np.float32(self.factor) * (levels - grey)
+
+
+class BrightnessOp(PointOp):
+    """Same result as ImageEnhance.Brightness: scale towards black"""
+
+    def __init__(self, factor):
+        super().__init__("brightness", factor=factor)
+        self.factor = factor
+
+    def curve(self, means):
+        return np.float32(self.factor) * np.arange(256, dtype=np.float32)
+
+
+class RegionOp(EditOp):
+    """Applies another op to a rectangle of the image only.
+
+    The region is cropped, processed and pasted back. The processed patch is
+    kept (an op's input never changes), so re-rendering after an undo of a
+    later edit repeats only the paste, and the memory held for the edit is
+    the size of the region rather than of the whole image.
+    """
+
+    def __init__(self, op, box):
+        super().__init__(op.name)
+        self.op = op
+        self.box = tuple(box)  # (left, top, right, bottom) in image pixels
+        self._patch = None
+
+    def apply(self, image):
+        if self._patch is None:
+            self._patch = self.op.apply(image.crop(self.box))
+        patch = self._patch
+        if patch.mode != image.mode:
+            # e.g. background removal adds alpha to an RGB image
+            mode = "RGBA" if _has_alpha(image) or _has_alpha(patch) else "RGB"
+            image = image.convert(mode)
+            patch = patch.convert(mode)
+        else:
+            image = image.copy()
+        image.paste(patch, self.box[:2])
+        return image
+
+    def describe(self):
+        return dict(self.op.describe(), region=list(self.box))
+
+
+def _has_alpha(image):
+    return "A" in image.getbands() or "transparency" in image.info
+
+
+def apply_point_ops(image, ops):
+    """Apply a run of point ops as a single lookup-table pass"""
+    image, table = point_table(image, ops)
+    return image.point(table)
+
+
+def point_table(image, ops):
+    """Compose a run of point ops into one lookup table for image.
+
+    Ops whose curve depends on image statistics (contrast) get the means of
+    the image as it would be after the preceding ops; these are derived from
+    the input histogram pushed through the composed table rather than from
+    an intermediate image. Returns the image (converted if its mode has no
+    per-band table) and the table, which can then be applied tile by tile.
+    """
+    if image.mode not in ("L", "RGB", "RGBA"):
+        image = image.convert("RGBA")
+    bands = image.getbands()
+    color_bands = [i for i, band in enumerate(bands) if band != "A"]
+    histogram = np.array(image.histogram(), dtype=np.float64).reshape(len(bands), 256)
+    total = max(1, image.width * image.height)
+
+    identity = np.arange(256)
+    composite = [identity.copy() for _ in bands]
+    for op in ops:
+        means = [np.bincount(composite[i], weights=histogram[i], minlength=256) @ identity / total
+                 for i in color_bands]
+        # Image.blend clips and truncates; match it so a fused run equals step-by-step
+        table = np.clip(op.curve(means), 0, 255).astype(np.uint8)
+        for i in color_bands:
+            composite[i] = table[composite[i]]
+
+    return image, np.concatenate(composite).tolist()
+
+
+def image_nbytes(image):
+    """Uncompressed size of an image's pixel data"""
+    return image.width * image.height * len(image.getbands())
+
+
+class RenderCache:
+    """Least-recently-used images for one edit graph, bounded by bytes.
+
+    Holds both whole-chain renders (keyed by the op tuple) and the outputs of
+    expensive ops (keyed by ("output", op)), so all the full-size images kept
+    for fast undo/redo share a single budget. The most recent entry is kept
+    even if it alone exceeds the budget. Safe to use from several threads.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_entries=16):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= image_nbytes(self._entries.pop(key))
+            self._entries[key] = image
+            self.nbytes += image_nbytes(image)
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries
+                                              or self.nbytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= image_nbytes(evicted)
+
+
+class EditGraph:
+    """An immutable chain of edits on top of a base image.
+
+    append/undo/redo return new graphs, so a worker thread can render a
+    candidate graph while the UI keeps the current one. Rendering starts from
+    the latest cached expensive result and fuses each run of adjacent point
+    ops into one pass.
+
+    Graphs derived from the same base share a RenderCache of recent renders
+    keyed by their op chain, so undoing or redoing to a recently shown state
+    returns the very same image object without evaluating anything.
+    """
+
+    def __init__(self, base, ops=(), redo_ops=(), renders=None):
+        self.base = base
+        self.ops = tuple(ops)
+        self.redo_ops = tuple(redo_ops)
+        self._renders = RenderCache() if renders is None else renders
+
+    def append(self, op):
+        return EditGraph(self.base, self.ops + (op,), renders=self._renders)
+
+    def undo(self):
+        """Drop the last op; it can be brought back with redo"""
+        return EditGraph(self.base, self.ops[:-1], self.redo_ops + self.ops[-1:], self._renders)
+
+    def redo(self):
+        return EditGraph(self.base, self.ops + self.redo_ops[-1:], self.redo_ops[:-1], self._renders)
+
+    def can_undo(self):
+        return bool(self.ops)
+
+    def can_redo(self):
+        return bool(self.redo_ops)
+
+    def describe(self):
+        """The applied edits, oldest first, as stored with saved assets"""
+        return [op.describe() for op in self.ops]
+
+    def rendered(self):
+        """The result if this chain was rendered recently, otherwise None"""
+        if not self.ops:
+            return self.base
+        return self._renders.get(self.ops)
+
+    def cached_bytes(self):
+        """Memory held by the render cache shared with related graphs"""
+        return self._renders.nbytes
+
+    def render(self):
+        """Evaluate the chain (once) and return the resulting image"""
+        image = self.rendered()
+        if image is None:
+            image = self._evaluate()
+            self._renders.put(self.ops, image)
+        return image
+
+    def _evaluate(self):
+        image = self.base
+        start = 0
+        for i in range(len(self.ops) - 1, -1, -1):
+            output = self._renders.get(("output", self.ops[i])) if self.ops[i].expensive else None
+            if output is not None:
+                image = output
+                start = i + 1
+                break
+
+        i = start
+        while i < len(self.ops):
+            if isinstance(self.ops[i], PointOp):
+                j = i
+                while j < len(self.ops) and isinstance(self.ops[j], PointOp):
+                    j += 1
+                image = apply_point_ops(image, self.ops[i:j])
+                i = j
+            else:
+                op = self.ops[i]
+                image = op.apply(image)
+                if op.expensive:
+                    self._renders.put(("output", op), image)
+                i += 1
+        return image
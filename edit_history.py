@@ -0,0 +1,109 @@
+"""
+Memory-bounded undo/redo history of compressed image snapshots
+"""
+
+import zlib
+from collections import deque
+
+from PIL import Image
+
+
+class Snapshot:
+    """A zlib-compressed copy of an image's pixels.
+
+    Pixel art is mostly flat runs of colour, so even the fastest zlib level
+    shrinks a 1024x1024 RGBA frame from 4 MB to a few tens of KB.
+    """
+
+    def __init__(self, image, level=1):
+        self.mode = image.mode
+        self.size = image.size
+        self.palette = image.getpalette() if image.mode == "P" else None
+        self.info = {k: v for k, v in image.info.items() if k == "transparency"}
+        self.data = zlib.compress(image.tobytes(), level)
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def restore(self):
+        """Rebuild the image this snapshot was taken from"""
+        image = Image.frombytes(self.mode, self.size, zlib.decompress(self.data))
+        if self.palette is not None:
+            image.putpalette(self.palette)
+        image.info.update(self.info)
+        return image
+
+
+class EditHistory:
+    """Undo and redo stacks that stay within a compressed-byte budget.
+
+    When the budget is exceeded the oldest undo states are dropped first,
+    then the furthest redo states; the most recent undo state is always kept.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, level=1):
+        self.max_bytes = max_bytes
+        self.level = level
+        self._undo = deque()
+        self._redo = []
+        self.nbytes = 0
+
+    def push(self, image):
+        """Record the state before an edit; starts a new branch so redo is cleared"""
+        self.discard_redo()
+        self._add(self._undo, image)
+        self._evict()
+
+    def discard_redo(self):
+        """Forget undone states, e.g. once a new edit starts another branch"""
+        self.nbytes -= sum(s.nbytes for s in self._redo)
+        self._redo.clear()
+
+    def undo(self, current):
+        """Return the previous image (or None) and remember current for redo"""
+        if not self._undo:
+            return None
+        snapshot = self._undo.pop()
+        self.nbytes -= snapshot.nbytes
+        if current is not None:
+            self._add(self._redo, current)
+            self._evict()
+        return snapshot.restore()
+
+    def redo(self, current):
+        """Return the next image (or None) and remember current for undo"""
+        if not self._redo:
+            return None
+        snapshot = self._redo.pop()
+        self.nbytes -= snapshot.nbytes
+        if current is not None:
+            self._add(self._undo, current)
+            self._evict()
+        return snapshot.restore()
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self.nbytes = 0
+
+    def describe(self):
+        """Short summary for the status bar"""
+        return f"History: {len(self._undo)} undo / {len(self._redo)} redo, {self.nbytes / (1024 * 1024):.1f} MB"
+
+    def _add(self, stack, image):
+        snapshot = Snapshot(image, self.level)
+        stack.append(snapshot)
+        self.nbytes += snapshot.nbytes
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and len(self._undo) > 1:
+            self.nbytes -= self._undo.popleft().nbytes
+        while self.nbytes > self.max_bytes and self._redo:
+            self.nbytes -= self._redo.pop(0).nbytes
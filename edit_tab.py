@@ -6,28 +6,39 @@ from tkinter import ttk, messagebox, simpledialog
 import os
 from PIL import Image, ImageTk
 
+from image_processor import ImageProcessor
+from palettes import PALETTES
+
 # Unified icon loading: use file if exists, otherwise generate placeholder
 ICON_DIR = os.path.join(os.path.dirname(__file__), 'icons')
-os.makedirs(ICON_DIR, exist_ok=True)
 
-# Prepare raw PIL images for icons; actual PhotoImages created in setup_edit_tab
+# Raw PIL images for icons; actual PhotoImages created in setup_edit_tab
 ICON_SPECS = [
     ('undo','undo.png','#e74c3c'),
+    ('redo','redo.png','#c0392b'),
     ('more','more_pixelated.png','#3498db'),
     ('less','less_pixelated.png','#2ecc71'),
     ('remove_bg','remove_bg.png','#e67e22'),
     ('contrast','contrast.png','#9b59b6'),
     ('brightness','brightness.png','#f1c40f'),
     ('resize','resize.png','#95a5a6'),
+    ('palette','palette.png','#16a085'),
 ]
 raw_icons = {}
-for key, fname, color in ICON_SPECS:
-    p = os.path.join(ICON_DIR, fname)
-    if os.path.exists(p):
-        img = Image.open(p)
-    else:
-        img = Image.new('RGBA', (16,16), color)
-    raw_icons[key] = img.resize((16,16))
+
+
+def load_icons():
+    """Load the icon images the first time the tab is built rather than on import"""
+    if not raw_icons:
+        for key, fname, color in ICON_SPECS:
+            p = os.path.join(ICON_DIR, fname)
+            if os.path.exists(p):
+                img = Image.open(p)
+            else:
+                img = Image.new('RGBA', (16,16), color)
+            raw_icons[key] = img.resize((16,16))
+    return raw_icons
+
 
 def setup_edit_tab(parent, app):
     """Create and pack the edit tools UI into the given parent frame."""
@@ -36,22 +47,41 @@ def setup_edit_tab(parent, app):
     
     # Create PhotoImage instances bound to this parent to avoid root-timing issues
     photo_icons = {}
-    for key, pil_img in raw_icons.items():
+    for key, pil_img in load_icons().items():
         photo_icons[key] = ImageTk.PhotoImage(pil_img, master=parent)
 
     # Vertical tool buttons with icons
     for key, text, cmd in [
         ('undo', 'Undo', app.undo_edit),
+        ('redo', 'Redo', app.redo_edit),
         ('more', 'More Pixelated', app.apply_more_pixelation),
         ('less', 'Less Pixelated', app.apply_less_pixelation),
         ('remove_bg', 'Remove Background', app.remove_background),
         ('contrast', 'Increase Contrast', app.increase_contrast),
         ('brightness', 'Increase Brightness', app.increase_brightness),
         ('resize', 'Resize Image', app.resize_image),
+        ('palette', 'Apply Palette', app.apply_palette),
     ]:
         btn = ttk.Button(tools_frame, text=text, command=cmd, image=photo_icons[key], compound='left')
         btn.pack(fill=tk.X, pady=2)
         btn.image = photo_icons[key]
     
+    ttk.Label(tools_frame, text="Drag on the image to edit only a region (Esc selects all)",
+              foreground='gray').pack(anchor=tk.W, pady=(5, 0))
+    
     # Checkbox for automatic background removal
     ttk.Checkbutton(tools_frame, text="Auto Remove Background", variable=app.auto_remove_bg).pack(anchor=tk.W, pady=(10, 0))
+    
+    # Background removal quality: fast (low-res mask) up to full alpha matting
+    quality_frame = ttk.Frame(tools_frame)
+    quality_frame.pack(fill=tk.X, pady=(5, 0))
+    ttk.Label(quality_frame, text="Background Quality:").pack(side=tk.LEFT)
+    ttk.Combobox(quality_frame, textvariable=app.bg_quality, values=ImageProcessor.BG_QUALITY_MODES,
+                 state='readonly', width=10).pack(side=tk.LEFT, padx=(5, 0))
+    
+    # Palette used by the Apply Palette tool
+    palette_frame = ttk.Frame(tools_frame)
+    palette_frame.pack(fill=tk.X, pady=(5, 0))
+    ttk.Label(palette_frame, text="Palette:").pack(side=tk.LEFT)
+    ttk.Combobox(palette_frame, textvariable=app.palette_choice, values=list(PALETTES) + ["adaptive"],
+                 state='readonly', width=10).pack(side=tk.LEFT, padx=(5, 0))
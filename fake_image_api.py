@@ -0,0 +1,285 @@
+"""
+Local stand-in for the Azure OpenAI images endpoint, for offline load tests
+
+Serves POST .../images/generations with a generated pixel-art PNG, returned
+inline (b64_json) or as a URL served by the same server. Response time,
+429 and 5xx failures and a requests-per-minute quota are configurable, and
+GET /stats reports what the server saw. A share of requests can also be made
+to stall, to exercise client timeouts and hedging.
+
+Usage:
+    python fake_image_api.py [--port 8765] [--latency-ms 2000 --latency-dist lognormal]
+                             [--rate-429 0.05] [--rate-5xx 0.02] [--rpm 60] [--rate-stall 0.01]
+
+Point the app at it with AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8765 and any
+AZURE_OPENAI_API_KEY.
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, ImageDraw
+
+
+class LatencyModel:
+    """Response-time distribution: fixed, uniform (mean +/- spread) or lognormal (sigma = spread)"""
+
+    KINDS = ("fixed", "uniform", "lognormal")
+
+    def __init__(self, mean_ms=0.0, kind="fixed", spread=0.5, rng=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        self.mean_ms = mean_ms
+        self.kind = kind
+        self.spread = spread
+        self.rng = rng or random.Random()
+
+    def sample(self):
+        """One response time in seconds"""
+        if self.kind == "uniform":
+            spread_ms = self.mean_ms * self.spread
+            ms = self.rng.uniform(self.mean_ms - spread_ms, self.mean_ms + spread_ms)
+        elif self.kind == "lognormal" and self.mean_ms > 0:
+            ms = self.mean_ms * self.rng.lognormvariate(-self.spread ** 2 / 2, self.spread)  # keeps the mean
+        else:
+            ms = self.mean_ms
+        return max(0.0, ms) / 1000
+
+
+def render_sprite(prompt, size):
+    """A deterministic 8-bit style sprite for prompt, as PNG bytes"""
+    digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+    grid = 16
+    small = Image.new("RGBA", (grid, grid), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(small)
+    colors = [tuple(digest[i:i + 3]) + (255,) for i in range(0, 12, 3)]
+    for y in range(grid):
+        for x in range(grid // 2):
+            bit = digest[(y * grid // 2 + x) % len(digest)] >> (x % 8) & 1
+            if bit and 2 <= y < grid - 2:
+                color = colors[(x + y) % len(colors)]
+                draw.point((x, y), fill=color)
+                draw.point((grid - 1 - x, y), fill=color)  # mirrored like most sprites
+    buffer = io.BytesIO()
+    small.resize(size, Image.NEAREST).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeImageAPI:
+    """In-process fake images API; use as a context manager or start()/stop()"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, rate_429=0.0, rate_5xx=0.0,
+                 retry_after=1.0, requests_per_minute=None, download_latency=None, seed=None,
+                 rate_stall=0.0, stall_seconds=60.0):
+        self.rng = random.Random(seed)
+        self.latency = latency or LatencyModel(rng=self.rng)
+        self.download_latency = download_latency or LatencyModel(rng=self.rng)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.requests_per_minute = requests_per_minute
+        self.rate_stall = rate_stall
+        self.stall_seconds = stall_seconds
+        self._lock = threading.Lock()
+        self._recent = deque()  # accepted request times inside the last minute
+        self._blobs = {}
+        self._sprites = {}
+        self._in_flight = 0
+        self.counters = {"requests": 0, "ok": 0, "throttled": 0, "quota_throttled": 0, "server_errors": 0,
+                         "stalled": 0, "downloads": 0, "max_in_flight": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-image-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def _admit(self):
+        """Decide how to answer one generation request: None (serve) or (status, retry_after)"""
+        with self._lock:
+            if self.requests_per_minute:
+                now = time.monotonic()
+                while self._recent and now - self._recent[0] >= 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.requests_per_minute:
+                    self.counters["quota_throttled"] += 1
+                    return 429, 60 - (now - self._recent[0])
+                self._recent.append(now)
+            roll = self.rng.random()
+        if roll < self.rate_429:
+            self._count("throttled")
+            return 429, self.retry_after
+        if roll < self.rate_429 + self.rate_5xx:
+            self._count("server_errors")
+            return self.rng.choice((500, 503)), None
+        return None
+
+    def _sprite(self, prompt, size):
+        key = (prompt, size)
+        with self._lock:
+            png = self._sprites.get(key)
+        if png is None:
+            png = render_sprite(prompt, size)
+            with self._lock:
+                if len(self._sprites) > 256:
+                    self._sprites.clear()
+                self._sprites[key] = png
+        return png
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass  # keep load-test output readable
+
+            def _send_json(self, status, body, headers=None):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    self._send_json(200, api.stats())
+                    return
+                if self.path.startswith("/blobs/"):
+                    with api._lock:
+                        png = api._blobs.pop(self.path[len("/blobs/"):], None)
+                    if png is None:
+                        self._send_json(404, {"error": {"code": "BlobNotFound", "message": "Unknown blob"}})
+                        return
+                    time.sleep(api.download_latency.sample())
+                    api._count("downloads")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/png")
+                    self.send_header("Content-Length", str(len(png)))
+                    self.end_headers()
+                    self.wfile.write(png)
+                    return
+                self._send_json(404, {"error": {"code": "NotFound", "message": self.path}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": {"code": "BadRequest", "message": "Invalid JSON"}})
+                    return
+                if not self.path.split("?")[0].endswith("/images/generations"):
+                    self._send_json(404, {"error": {"code": "NotFound", "message": self.path}})
+                    return
+
+                with api._lock:
+                    api.counters["requests"] += 1
+                    api._in_flight += 1
+                    api.counters["max_in_flight"] = max(api.counters["max_in_flight"], api._in_flight)
+                try:
+                    with api._lock:
+                        stall = api.rng.random() < api.rate_stall
+                    if stall:
+                        api._count("stalled")
+                    time.sleep(api.stall_seconds if stall else api.latency.sample())
+                    verdict = api._admit()
+                    if verdict is not None:
+                        status, retry_after = verdict
+                        headers = {}
+                        if retry_after is not None:
+                            headers["Retry-After"] = str(max(1, round(retry_after)))
+                            headers["retry-after-ms"] = str(int(retry_after * 1000))
+                        code = "429" if status == 429 else "InternalServerError"
+                        self._send_json(status, {"error": {"code": code, "message": "Injected failure"}}, headers)
+                        return
+
+                    width, height = (int(v) for v in request.get("size", "1024x1024").split("x"))
+                    png = api._sprite(request.get("prompt", ""), (width, height))
+                    if request.get("response_format") == "url":
+                        blob_id = f"{uuid.uuid4().hex}.png"
+                        with api._lock:
+                            api._blobs[blob_id] = png
+                        item = {"url": f"{api.endpoint}/blobs/{blob_id}"}
+                    else:
+                        item = {"b64_json": base64.b64encode(png).decode("ascii")}
+                    item["revised_prompt"] = request.get("prompt", "")
+                    api._count("ok")
+                    self._send_json(200, {"created": int(time.time()), "data": [item]})
+                finally:
+                    with api._lock:
+                        api._in_flight -= 1
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0, help="mean generation time")
+    parser.add_argument("--latency-dist", choices=LatencyModel.KINDS, default="fixed")
+    parser.add_argument("--spread", type=float, default=0.5, help="uniform: +/- fraction of mean; lognormal: sigma")
+    parser.add_argument("--download-latency-ms", type=float, default=0, help="time to serve a URL response blob")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="fraction of requests answered 500/503")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on injected 429s")
+    parser.add_argument("--rpm", type=int, default=None, help="requests-per-minute quota (429 beyond it)")
+    parser.add_argument("--rate-stall", type=float, default=0.0, help="fraction of requests that hang")
+    parser.add_argument("--stall-seconds", type=float, default=60.0, help="how long a stalled request hangs")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    api = FakeImageAPI(args.host, args.port, LatencyModel(args.latency_ms, args.latency_dist, args.spread, rng),
+                       args.rate_429, args.rate_5xx, args.retry_after, args.rpm,
+                       LatencyModel(args.download_latency_ms, args.latency_dist, args.spread, rng), args.seed,
+                       args.rate_stall, args.stall_seconds)
+    print(f"Fake images API listening on {api.endpoint} (stats at {api.endpoint}/stats)")
+    try:
+        api._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Single frame loop for canvas redraws and animations
+"""
+
+import time
+from collections import OrderedDict, deque
+
+
+class FrameScheduler:
+    """Coalesces canvas work into frames on the Tk event loop.
+
+    request(name, fn) queues a redraw; requests made before the next idle
+    point are merged so each name runs at most once per frame. Animations
+    registered with animate() tick at interval_ms while the window has focus,
+    at background_interval_ms when it does not, and not at all while it is
+    iconified. When nothing is pending and nothing animates, no timer is
+    scheduled at all.
+    """
+
+    def __init__(self, root, interval_ms=50, background_interval_ms=500, on_stats=None):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.background_interval_ms = background_interval_ms
+        self.on_stats = on_stats  # called with stats() at most once a second
+        self.focused = True
+        self.visible = True
+        self._pending = OrderedDict()
+        self._animations = OrderedDict()
+        self._job = None
+        self._job_is_idle = False
+        self._next_tick = 0.0
+        self._frame_times = deque(maxlen=240)
+        self._frames = 0
+        self._last_report = 0.0
+
+        root.bind("<FocusIn>", lambda event: self._set_focus(True), add="+")
+        root.bind("<FocusOut>", lambda event: self._set_focus(False), add="+")
+        root.bind("<Map>", lambda event: self._set_visible(event, True), add="+")
+        root.bind("<Unmap>", lambda event: self._set_visible(event, False), add="+")
+
+    def request(self, name, fn):
+        """Run fn in the next frame; a later request with the same name replaces it"""
+        self._pending[name] = fn
+        if self._job is not None and not self._job_is_idle:
+            self.root.after_cancel(self._job)
+            self._job = None
+        if self._job is None:
+            self._job = self.root.after_idle(self._frame)
+            self._job_is_idle = True
+
+    def animate(self, name, fn):
+        """Call fn once per animation tick until stop(name)"""
+        self._animations[name] = fn
+        self._schedule_tick()
+
+    def stop(self, name):
+        self._animations.pop(name, None)
+        self._pending.pop(name, None)
+
+    def stats(self):
+        """Frame count and frame times in milliseconds over the recent window"""
+        times = sorted(self._frame_times)
+        if not times:
+            return {"frames": self._frames, "mean_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        return {
+            "frames": self._frames,
+            "mean_ms": sum(times) / len(times),
+            "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))],
+            "max_ms": times[-1],
+        }
+
+    def _tick_interval(self):
+        return self.interval_ms if self.focused else self.background_interval_ms
+
+    def _set_focus(self, focused):
+        # Focus moving between our own widgets sends FocusOut then FocusIn,
+        # so the flag settles before the next tick reads it
+        self.focused = focused
+        if focused:
+            self._schedule_tick()
+
+    def _set_visible(self, event, visible):
+        if event.widget is not self.root:
+            return
+        self.visible = visible
+        if visible:
+            self._schedule_tick()
+
+    def _schedule_tick(self):
+        if self._job is not None or not self._animations or not self.visible:
+            return
+        delay = max(0, int((self._next_tick - time.monotonic()) * 1000))
+        self._job = self.root.after(delay, self._frame)
+        self._job_is_idle = False
+
+    def _frame(self):
+        self._job = None
+        started = time.perf_counter()
+
+        pending, self._pending = self._pending, OrderedDict()
+        for fn in pending.values():
+            fn()
+
+        now = time.monotonic()
+        if self._animations and self.visible and now >= self._next_tick:
+            for fn in list(self._animations.values()):
+                fn()
+            self._next_tick = now + self._tick_interval() / 1000
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self._frame_times.append(elapsed)
+        self._frames += 1
+        if self.on_stats and now - self._last_report >= 1.0:
+            self._last_report = now
+            self.on_stats(self.stats())
+
+        if self._pending and self._job is None:
+            self._job = self.root.after_idle(self._frame)
+            self._job_is_idle = True
+        else:
+            self._schedule_tick()
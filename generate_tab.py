@@ -22,6 +22,7 @@ def setup_generate_tab(parent, app):
     app.chat_history.insert(tk.END, "- 'medieval knight'\n")
     app.chat_history.insert(tk.END, "- 'magic potion bottle'\n")
     app.chat_history.insert(tk.END, "- 'fantasy sword'\n")
+    app.chat_history.insert(tk.END, "\nPut several prompts on separate lines to queue a batch.\n")
     app.chat_history.insert(tk.END, "\nYou can customize the prompt template below to change\n")
     app.chat_history.insert(tk.END, "how your object is rendered. Use {prompt} as a placeholder.\n\n")
     app.chat_history.insert(tk.END, "Toggle 'Auto Remove Background' in the tools section\n")
@@ -59,7 +60,15 @@ def setup_generate_tab(parent, app):
     app.generate_btn.pack(fill=tk.X, pady=(0, 5))
     app.modify_btn = ttk.Button(button_frame, text="Modify Current", command=app.modify_image)
     app.modify_btn.pack(fill=tk.X)
+    ttk.Checkbutton(button_frame, text="Force Fresh (skip cache)", variable=app.force_fresh).pack(anchor=tk.W, pady=(5, 0))
     
     # Progress bar
     app.progress = ttk.Progressbar(chat_frame, mode='indeterminate')
     app.progress.pack(fill=tk.X, pady=(10, 0))
+    
+    # Job queue status
+    jobs_frame = ttk.Frame(chat_frame)
+    jobs_frame.pack(fill=tk.X, pady=(5, 0))
+    app.jobs_var = tk.StringVar(value="Jobs: idle")
+    ttk.Label(jobs_frame, textvariable=app.jobs_var).pack(side=tk.LEFT)
+    ttk.Button(jobs_frame, text="Cancel Jobs", command=app.cancel_jobs).pack(side=tk.RIGHT)
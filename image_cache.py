@@ -0,0 +1,138 @@
+"""
+Persistent content-addressed cache for generated images
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class ImageCache:
+    """On-disk LRU cache of raw image bytes keyed by generation parameters.
+
+    Entries are stored as ``<sha256>.png`` files under ``cache_dir``. The
+    least recently used entries are evicted once either ``max_entries`` or
+    ``max_bytes`` is exceeded. Recency is persisted through file mtimes so the
+    LRU order survives restarts.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=512 * 1024 * 1024, max_entries=1000):
+        if cache_dir is None:
+            cache_dir = os.getenv("IMAGE_CACHE_DIR", os.path.join("generated_images", ".cache"))
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, oldest first
+        self._total_bytes = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(model, prompt, size, quality, output_format):
+        """Build a stable cache key from the parameters that determine the image"""
+        payload = json.dumps([model, prompt, size, quality, output_format], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _load_index(self):
+        """Rebuild the in-memory LRU index from the files already on disk"""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".png"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            found.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def get(self, key):
+        """Return cached bytes for key, or None on a miss"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                # File vanished underneath us; treat as a miss
+                self._total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Store bytes under key and evict old entries if over budget"""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Error writing image cache entry: {e}")
+                return
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def discard(self, key):
+        """Drop key, e.g. because its bytes turned out not to decode"""
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self._lock:
+            for key in list(self._entries):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        """Return hit/miss counters and current footprint"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
@@ -2,60 +2,287 @@
 Image generation module using OpenAI's DALL-E API
 """
 
+import asyncio
+import base64
 import os
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from io import BytesIO
 from PIL import Image
 import openai
 from dotenv import load_dotenv
 
+from image_cache import ImageCache
+from rate_limiter import TokenBucket
+from instrumentation import span
+from resilience import (CircuitBreaker, CircuitOpenError, Counters, DeadlineExceeded, ResilientCaller,
+                        backoff_delay, is_transient, parse_hedge_after)
+
 load_dotenv()
 
 
+class GenerationError(Exception):
+    """A generation failed; `transient` is True when trying again later may succeed"""
+
+    def __init__(self, message, transient=False):
+        super().__init__(message)
+        self.transient = transient
+
+
+class BatchResult:
+    """Outcome of one prompt in a generate_batch run"""
+
+    def __init__(self, index, prompt, image=None, error=None):
+        self.index = index
+        self.prompt = prompt
+        self.image = image
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
 
 class ImageGenerator:
-    def __init__(self):
+    def __init__(self, cache=None, endpoint=None, api_key=None, client=None, async_client=None):
+        """endpoint/api_key override the environment (e.g. to target fake_image_api.py);
+        client/async_client replace the OpenAI clients entirely"""
         # You will need to set these environment variables or edit the following values.
-        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "https://rchio-mb1ft4rz-eastus.cognitiveservices.azure.com/")
+        endpoint = endpoint or os.getenv("AZURE_OPENAI_ENDPOINT", "https://rchio-mb1ft4rz-eastus.cognitiveservices.azure.com/")
         api_version = os.getenv("OPENAI_API_VERSION", "2024-04-01-preview")
-        api_key = os.getenv("AZURE_OPENAI_API_KEY")
+        api_key = api_key or os.getenv("AZURE_OPENAI_API_KEY")
 
-        self.client = openai.AzureOpenAI(
+        self.client = client if client is not None else openai.AzureOpenAI(
             api_version=api_version,
             azure_endpoint=endpoint,
             api_key=api_key,
+            max_retries=0,  # retries go through self.resilience so they share the deadline
         )
+        # Built on first use by generate_batch; retries are handled there so
+        # Retry-After can be shared across the whole batch
+        self._client_args = dict(api_version=api_version, azure_endpoint=endpoint, api_key=api_key)
+        self._async_client = async_client
+        self.requests_per_minute = float(os.getenv("AZURE_OPENAI_IMAGES_RPM", "6"))
+        self.request_timeout = float(os.getenv("AZURE_OPENAI_TIMEOUT", "120"))  # seconds per attempt
+        self.deadline = float(os.getenv("AZURE_OPENAI_DEADLINE", "300"))  # seconds per image, retries included
+        # Shared by all callers: one breaker per endpoint, counters for monitoring
+        self.counters = Counters()
+        self.breaker = CircuitBreaker(int(os.getenv("AZURE_OPENAI_BREAKER_FAILURES", "5")),
+                                      float(os.getenv("AZURE_OPENAI_BREAKER_RESET", "30")), self.counters)
+        self.resilience = ResilientCaller(int(os.getenv("AZURE_OPENAI_MAX_RETRIES", "3")),
+                                          parse_hedge_after(os.getenv("AZURE_OPENAI_HEDGE_AFTER")),
+                                          self.breaker, self.counters)
+
+        self.model = "dall-e-3"
+        self.quality = "standard"
+        self.output_format = "png"
+        # "b64_json" returns the image inline and skips the second download;
+        # "url" falls back to fetching the blob over the pooled session below
+        self.response_format = os.getenv("AZURE_OPENAI_IMAGE_RESPONSE_FORMAT", "b64_json")
+        self.download_timeout = (5, 30)  # (connect, read) seconds
+        self.download_deadline = 120  # seconds for the whole body
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+        # Repeated prompts are served from disk instead of hitting the API
+        self.cache = cache if cache is not None else ImageCache()
     
    
-    def generate_image(self, prompt, size="1024x1024"):
-        """Generate a new pixelated image from prompt"""
+    def generate_image(self, prompt, size="1024x1024", force_refresh=False):
+        """Generate a new pixelated image from prompt
+
+        Results are cached on disk; pass force_refresh=True to bypass the
+        cache lookup and always request a fresh image. The API call and the
+        download share self.deadline; each retries transient failures on its
+        own so a failed download does not pay for a second generation.
+        """
         try:
-           
-            response = self.client.images.generate(
-                model="dall-e-3",
-                prompt=prompt,
-                size=size,
-                quality="standard",
-                background="transparent",
-                output_format="png",
-                n=1,
-            )
-            
-            image_url = response.data[0].url
-            
-            # Download the image
-            image_response = requests.get(image_url)
-            image = Image.open(BytesIO(image_response.content))
-           
+            cache_key = self.cache.make_key(self.model, prompt, size, self.quality, self.output_format)
+            if not force_refresh:
+                with span("cache_lookup"):
+                    cached = self.cache.get(cache_key)
+                image = self._decode_cached(cache_key, cached)
+                if image is not None:
+                    return image
+
+            deadline_at = time.monotonic() + self.deadline
+            response = self.resilience.call(lambda timeout: self._request(prompt, size, timeout),
+                                            deadline_at, hedge=True)
+            item = response.data[0]
+            content = self.resilience.call(lambda timeout: self._fetch(item, timeout), deadline_at,
+                                           stage="download", use_breaker=False)
+            # Only cache what decodes, so a truncated payload isn't served forever
+            image = self._decode(content)
+            self.cache.put(cache_key, content)
             return image
-            
+
+        except CircuitOpenError as e:
+            raise GenerationError(f"Failed to generate image: {str(e)}", transient=True) from e
         except Exception as e:
-            raise Exception(f"Failed to generate image: {str(e)}")
-    
-    def modify_image(self, current_image, prompt, size="1024x1024"):
+            raise GenerationError(f"Failed to generate image: {str(e)}", transient=is_transient(e)) from e
+
+    def resilience_stats(self):
+        """Counters for monitoring (api_attempts, api_retries, api_timeouts, hedges, ...) and breaker state"""
+        stats = self.counters.snapshot()
+        stats["breaker"] = self.breaker.state
+        return stats
+
+    def _request(self, prompt, size, timeout):
+        with span("api", size=size):
+            return self.client.images.generate(**self._request_params(prompt, size),
+                                               timeout=min(self.request_timeout, timeout))
+
+    def _fetch(self, item, timeout):
+        with span("download", response_format=self.response_format):
+            return self._image_bytes(item, timeout)
+
+    def _decode(self, content):
+        """Decode image bytes now, on the calling (worker) thread"""
+        with span("decode", bytes=len(content)):
+            image = Image.open(BytesIO(content))
+            image.load()
+        return image
+
+    def _decode_cached(self, cache_key, cached):
+        """Decode a cache hit; a corrupt entry is evicted and None returned"""
+        if cached is None:
+            return None
+        try:
+            return self._decode(cached)
+        except (OSError, ValueError, SyntaxError):
+            self.cache.discard(cache_key)
+            return None
+
+    def _request_params(self, prompt, size):
+        return dict(
+            model=self.model,
+            prompt=prompt,
+            size=size,
+            quality=self.quality,
+            background="transparent",
+            output_format=self.output_format,
+            response_format=self.response_format,
+            n=1,
+        )
+
+    def _image_bytes(self, item, timeout=None):
+        """Return encoded image bytes from an images API result item"""
+        if getattr(item, "b64_json", None):
+            return base64.b64decode(item.b64_json)
+        return self._download(item.url, timeout)
+
+    def _download(self, url, timeout=None):
+        """Fetch the generated image bytes over the shared keep-alive session
+
+        timeout, if given, further limits both the read timeout and the
+        total download time (e.g. to what is left of the caller's deadline).
+        """
+        started = time.monotonic()
+        connect, read = self.download_timeout
+        deadline = self.download_deadline
+        if timeout is not None:
+            connect, read, deadline = min(connect, timeout), min(read, timeout), min(deadline, timeout)
+        with self.http.get(url, timeout=(connect, read), stream=True) as image_response:
+            image_response.raise_for_status()
+            chunks = []
+            for chunk in image_response.iter_content(chunk_size=64 * 1024):
+                # The read timeout only bounds gaps between chunks; cap the total too
+                if time.monotonic() - started > deadline:
+                    raise TimeoutError(f"Image download exceeded {deadline:.0f}s")
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def generate_batch(self, prompts, size="1024x1024", concurrency=4,
+                             requests_per_minute=None, max_retries=3, force_refresh=False):
+        """Generate many images concurrently, yielding BatchResults as they complete
+
+        Requests are spaced by a token bucket sized to the deployment's
+        requests-per-minute limit. A 429 pauses the whole bucket for the
+        server's Retry-After before retrying; failures are reported per item
+        and never abort the rest of the batch. Items share the generator's
+        circuit breaker and counters, and each is bounded by self.deadline.
+        """
+        bucket = TokenBucket(requests_per_minute or self.requests_per_minute)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(index, prompt):
+            async with semaphore:
+                try:
+                    image = await self._generate_async(prompt, size, bucket, max_retries, force_refresh)
+                    return BatchResult(index, prompt, image=image)
+                except Exception as e:
+                    return BatchResult(index, prompt, error=f"Failed to generate image: {str(e)}")
+
+        tasks = [asyncio.ensure_future(run_one(i, prompt)) for i, prompt in enumerate(prompts)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Consumer stopped early; don't leave requests running in the background
+            for task in tasks:
+                task.cancel()
+
+    async def _generate_async(self, prompt, size, bucket, max_retries, force_refresh):
+        cache_key = self.cache.make_key(self.model, prompt, size, self.quality, self.output_format)
+        if not force_refresh:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            image = await asyncio.to_thread(self._decode_cached, cache_key, cached)
+            if image is not None:
+                return image
+
+        if self._async_client is None:
+            self._async_client = openai.AsyncAzureOpenAI(max_retries=0, **self._client_args)
+
+        deadline_at = time.monotonic() + self.deadline
+        for attempt in range(max_retries + 1):
+            await bucket.acquire()
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                self.counters.add("deadline_exceeded")
+                raise DeadlineExceeded("Deadline exceeded while waiting for the rate limit")
+            trial = self.breaker.before_call()
+            self.counters.add("api_attempts")
+            started = time.monotonic()
+            try:
+                with span("api", size=size, attempt=attempt):
+                    response = await self._async_client.images.generate(
+                        **self._request_params(prompt, size), timeout=min(self.request_timeout, remaining))
+                self.resilience.succeeded(seconds=time.monotonic() - started)
+                break
+            except Exception as e:
+                if not self.resilience.failed(e) or attempt == max_retries:
+                    self.counters.add("api_failures")
+                    raise
+                self.counters.add("api_retries")
+                delay = backoff_delay(attempt, e)
+                if isinstance(e, openai.RateLimitError):
+                    # The quota is shared, so every in-flight item has to back off
+                    bucket.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled mid-request: no verdict on the endpoint, but don't
+                # leave a half-open breaker waiting for this trial forever
+                if trial:
+                    self.breaker.release_trial()
+                raise
+
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            self.counters.add("deadline_exceeded")
+            raise DeadlineExceeded("Deadline exceeded before the image could be downloaded")
+        with span("download", response_format=self.response_format):
+            content = await asyncio.to_thread(self._image_bytes, response.data[0], remaining)
+        image = await asyncio.to_thread(self._decode, content)
+        await asyncio.to_thread(self.cache.put, cache_key, content)
+        return image
+
+    def modify_image(self, current_image, prompt, size="1024x1024", force_refresh=False):
         """Modify existing image based on prompt (simulate with new generation)"""
         # Note: DALL-E 3 doesn't support image editing, so we'll generate a new image
         # with a modified prompt that includes context about the current image
         modify_prompt = f"Modify this concept: {prompt}, pixel art style, 8-bit, pixelated"
-        return self.generate_image(modify_prompt, size)
+        return self.generate_image(modify_prompt, size, force_refresh)
     
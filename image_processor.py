@@ -2,48 +2,229 @@
 Image processing utilities
 """
 
-from PIL import Image, ImageFilter, ImageEnhance
+from PIL import Image, ImageChops, ImageFilter, ImageEnhance, PngImagePlugin
+import numpy as np
+import json
 import os
-from rembg import remove
-import io
+
+from asset_metadata import METADATA_KEY
+from edit_graph import BrightnessOp, ContrastOp, point_table
+from instrumentation import span, timed
+from palettes import kmeans_palette, map_to_palette, parse_palette
+from rembg_sessions import RembgSessionPool
+from tiling import map_tiles, resize_tiled
 
 class ImageProcessor:
+    # Shared by every remove_background call so the model is loaded only once
+    session_pool = RembgSessionPool()
+    BG_QUALITY_MODES = ("fast", "balanced", "matting")
+    # Images above this many pixels are processed in tiles to bound working memory
+    TILED_MIN_PIXELS = 4096 * 4096
+    TILE_SIZE = 1024
+    TILE_WORKERS = min(4, os.cpu_count() or 1)
+
+    @staticmethod
+    @timed("pixelate")
+    def pixelate(image, pixel_size=8, tile_size=None, workers=None):
+        """Apply pixelation effect
+
+        Every pixel_size x pixel_size block becomes the average of its pixels.
+        Colours are weighted by alpha so transparent surroundings don't bleed
+        into sprite edges, and the partial blocks of non-divisible sizes
+        average only the pixels they cover. Large images (or any image when
+        tile_size is given) are processed in block-aligned tiles, which gives
+        the same result with working memory bounded by the tile size.
+        """
+        if pixel_size <= 1:
+            return image.copy()
+        if image.mode not in ("L", "LA", "RGB", "RGBA"):
+            image = image.convert("RGBA")
+        if ImageProcessor._use_tiles(image.size, tile_size):
+            return map_tiles(image, lambda tile: ImageProcessor._pixelate(tile, pixel_size),
+                             max(tile_size or ImageProcessor.TILE_SIZE, pixel_size), align=pixel_size,
+                             workers=workers or ImageProcessor.TILE_WORKERS)
+        return ImageProcessor._pixelate(image, pixel_size)
+
+    @staticmethod
+    def _pixelate(image, pixel_size):
+        pixels = np.asarray(image)
+        if pixels.ndim == 2:
+            pixels = pixels[:, :, None]
+        height, width, channels = pixels.shape
+        has_alpha = image.mode in ("LA", "RGBA")
+
+        # Work in strips of whole block rows so temporaries stay small on huge images
+        strip = pixel_size * max(1, (1 << 20) // (pixel_size * max(1, width)))
+        small = np.concatenate([
+            ImageProcessor._block_average(pixels[top:top + strip], pixel_size, has_alpha)
+            for top in range(0, height, strip)
+        ]).astype(np.uint8)
+
+        # Scaling by an exact integer factor with NEAREST is a pure block
+        # replicate, done in C without a full-size intermediate array
+        small_image = Image.fromarray(small.squeeze(axis=2) if channels == 1 else small, image.mode)
+        upscaled = small_image.resize((small_image.width * pixel_size, small_image.height * pixel_size), Image.NEAREST)
+        if upscaled.size != (width, height):
+            upscaled = upscaled.crop((0, 0, width, height))
+        return upscaled
+
     @staticmethod
-    def pixelate(image, pixel_size=8):
-        """Apply pixelation effect"""
-        original_size = image.size
-        small_size = (original_size[0] // pixel_size, original_size[1] // pixel_size)
-        small_image = image.resize(small_size, Image.NEAREST)
-        return small_image.resize(original_size, Image.NEAREST)
+    def _block_average(pixels, p, has_alpha):
+        """Average each p x p block of a strip, returning one pixel per block"""
+        height, width, channels = pixels.shape
+        rows, cols = -(-height // p), -(-width // p)
+        coverage = None
+        if rows * p != height or cols * p != width:
+            # Zero padding carries no weight, so partial edge blocks average only real pixels
+            pad = ((0, rows * p - height), (0, cols * p - width))
+            pixels = np.pad(pixels, pad + ((0, 0),))
+            coverage = np.pad(np.ones((height, width), dtype=np.uint8), pad)
+
+        # 255 * 255 * p * p must fit the accumulator
+        acc = np.uint32 if p <= 256 else np.uint64
+        if has_alpha and pixels[:, :, -1].min() == 255 and coverage is None:
+            # Fully opaque strip: alpha weighting changes nothing, skip the premultiply
+            return (ImageProcessor._block_sum(pixels, p, acc) + (p * p) // 2) // (p * p)
+        if has_alpha:
+            alpha = pixels[:, :, -1]
+            weight_sum = ImageProcessor._block_sum(alpha, p, acc)
+            premultiplied = pixels[:, :, :-1] * alpha[:, :, None].astype(np.uint16)
+            color_sum = ImageProcessor._block_sum(premultiplied, p, acc)
+            count = ImageProcessor._block_sum(coverage, p, acc) if coverage is not None else acc(p * p)
+            alpha_avg = (weight_sum + count // 2) // count
+        else:
+            weight_sum = ImageProcessor._block_sum(coverage, p, acc) if coverage is not None else acc(p * p)
+            color_sum = ImageProcessor._block_sum(pixels, p, acc)
+        weight_sum = np.maximum(weight_sum, 1)
+        if np.ndim(weight_sum):
+            weight_sum = weight_sum[:, :, None]
+        small = (color_sum + weight_sum // 2) // weight_sum
+        if has_alpha:
+            small = np.concatenate([small, alpha_avg[:, :, None]], axis=2)
+        return small
+
+    @staticmethod
+    def _block_sum(a, p, dtype):
+        """Sum non-overlapping p x p blocks using strided adds (much faster than a 4-D reshape sum)"""
+        rows = a[0::p].astype(dtype)
+        for i in range(1, p):
+            rows += a[i::p]
+        blocks = rows[:, 0::p].copy()
+        for i in range(1, p):
+            blocks += rows[:, i::p]
+        return blocks
     
     @staticmethod
-    def resize_image(image, new_size, maintain_aspect=True):
-        """Resize image while maintaining pixelated style"""
-        if maintain_aspect:
-            image.thumbnail(new_size, Image.NEAREST)
-            return image
+    @timed("quantize")
+    def quantize(image, palette="pico-8", colors=16):
+        """Reduce image to a palette and return a true 8-bit ("P" mode) image
+
+        palette may be a name from palettes.PALETTES, a list of hex strings or
+        RGB tuples, an array from adaptive_palette (reuse it across a batch for
+        a consistent sprite set), or "adaptive" to fit `colors` colours to
+        this image. Pixels under half opacity map to a reserved transparent index.
+        """
+        rgba = np.asarray(image.convert("RGBA"))
+        opaque = rgba[:, :, 3] >= 128
+        if isinstance(palette, str) and palette == "adaptive":
+            sample = rgba[opaque][:, :3] if opaque.any() else rgba[:, :, :3]
+            palette = kmeans_palette(sample, colors)
         else:
-            return image.resize(new_size, Image.NEAREST)
+            palette = parse_palette(palette)
+
+        indices = map_to_palette(rgba[:, :, :3], palette)
+        flat_palette = palette.ravel().tolist()
+        transparent = None
+        if not opaque.all():
+            transparent = len(palette)
+            indices = np.where(opaque, indices, transparent).astype(np.uint8)
+            flat_palette += [0, 0, 0]
+
+        result = Image.fromarray(indices, "P")
+        result.putpalette(flat_palette)
+        if transparent is not None:
+            result.info["transparency"] = transparent
+        return result
+
+    @staticmethod
+    def adaptive_palette(images, colors=16, sample_size=20000):
+        """Fit one palette to several images so a sprite set shares its colours"""
+        per_image = max(1, sample_size // max(1, len(images)))
+        rng = np.random.default_rng(0)
+        samples = []
+        for image in images:
+            rgba = np.asarray(image.convert("RGBA"))
+            pixels = rgba[rgba[:, :, 3] >= 128][:, :3]
+            if len(pixels) > per_image:
+                pixels = pixels[rng.choice(len(pixels), per_image, replace=False)]
+            samples.append(pixels)
+        return kmeans_palette(np.concatenate(samples), colors, sample_size=sample_size)
+    
+    @staticmethod
+    @timed("resize")
+    def resize_image(image, new_size, maintain_aspect=True, tile_size=None, workers=None):
+        """Resize image while maintaining pixelated style
+
+        With maintain_aspect the image is shrunk to fit new_size like
+        thumbnail() (never enlarged), without modifying the input.
+        """
+        if maintain_aspect:
+            scale = min(new_size[0] / image.width, new_size[1] / image.height, 1)
+            new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            if new_size == image.size:
+                return image.copy()
+        if ImageProcessor._use_tiles(max(image.size, new_size, key=lambda size: size[0] * size[1]), tile_size):
+            return resize_tiled(image, new_size, tile_size or ImageProcessor.TILE_SIZE,
+                                workers or ImageProcessor.TILE_WORKERS)
+        return image.resize(new_size, Image.NEAREST)
     
     @staticmethod
-    def adjust_contrast(image, factor=1.2):
+    @timed("contrast")
+    def adjust_contrast(image, factor=1.2, tile_size=None, workers=None):
         """Adjust image contrast"""
+        if image.mode not in ("L", "RGB", "RGBA"):
+            image = image.convert("RGBA")  # ImageEnhance can't blend palette images
+        if ImageProcessor._use_tiles(image.size, tile_size):
+            return ImageProcessor._point_tiled(image, ContrastOp(factor), tile_size, workers)
         enhancer = ImageEnhance.Contrast(image)
         return enhancer.enhance(factor)
     
     @staticmethod
-    def adjust_brightness(image, factor=1.1):
+    @timed("brightness")
+    def adjust_brightness(image, factor=1.1, tile_size=None, workers=None):
         """Adjust image brightness"""
+        if image.mode not in ("L", "RGB", "RGBA"):
+            image = image.convert("RGBA")  # ImageEnhance can't blend palette images
+        if ImageProcessor._use_tiles(image.size, tile_size):
+            return ImageProcessor._point_tiled(image, BrightnessOp(factor), tile_size, workers)
         enhancer = ImageEnhance.Brightness(image)
         return enhancer.enhance(factor)
     
     @staticmethod
-    def save_image(image, filepath):
-        """Save image to file"""
+    def _use_tiles(size, tile_size):
+        """Tile when asked to, or automatically once an image is very large"""
+        return tile_size is not None or size[0] * size[1] > ImageProcessor.TILED_MIN_PIXELS
+    
+    @staticmethod
+    def _point_tiled(image, op, tile_size=None, workers=None):
+        # Same table as ImageEnhance would produce (statistics come from the
+        # whole-image histogram), applied one tile at a time
+        image, table = point_table(image, [op])
+        return map_tiles(image, lambda tile: tile.point(table), tile_size or ImageProcessor.TILE_SIZE,
+                         workers=workers or ImageProcessor.TILE_WORKERS)
+    
+    @staticmethod
+    def save_image(image, filepath, metadata=None):
+        """Save image to file, embedding metadata (prompt, edits, ...) in PNGs for the asset library"""
         try:
             # Ensure directory exists
             os.makedirs(os.path.dirname(filepath), exist_ok=True)
-            image.save(filepath)
+            if metadata and filepath.lower().endswith(".png"):
+                pnginfo = PngImagePlugin.PngInfo()
+                pnginfo.add_text(METADATA_KEY, json.dumps(metadata))
+                image.save(filepath, pnginfo=pnginfo)
+            else:
+                image.save(filepath)
             return True
         except Exception as e:
             print(f"Error saving image: {e}")
@@ -59,20 +240,65 @@ class ImageProcessor:
             return None
     
     @staticmethod
-    def remove_background(image: Image.Image) -> Image.Image:
-        """Remove background using rembg with alpha‐matting tuned to preserve interior colors."""
-        buf_in = io.BytesIO()
-        image.save(buf_in, format="PNG")
-        img_bytes = buf_in.getvalue()
-
-        # Enable alpha matting and lower the foreground threshold so internal pixels aren't dropped
-        result_bytes = remove(
-            img_bytes,
-            alpha_matting=True,
-            alpha_matting_foreground_threshold=200,   # lower = more pixels kept
-            alpha_matting_background_threshold=10,
-            alpha_matting_erode_size=3
-        )
-
-        buf_out = io.BytesIO(result_bytes)
-        return Image.open(buf_out).convert("RGBA")
+    def warm_up(background=True):
+        """Load the background removal model ahead of first use"""
+        return ImageProcessor.session_pool.warm_up(background)
+
+    @staticmethod
+    @timed("remove_background")
+    def remove_background(image: Image.Image, session=None, quality="fast",
+                          mask_size=320, mask_resample=Image.NEAREST) -> Image.Image:
+        """Remove background using rembg with alpha‐matting tuned to preserve interior colors.
+
+        The pixel buffer is handed to the segmentation model directly and the
+        resulting alpha is composed onto the source image, avoiding a PNG
+        encode/decode round trip on each side of the call.
+
+        quality picks the speed/fidelity trade-off:
+          "fast"     - segment a copy downscaled to mask_size and upsample the
+                       mask with mask_resample (nearest suits pixel art)
+          "balanced" - segment at full resolution without matting
+          "matting"  - full resolution plus alpha matting (slowest, softest edges)
+        """
+        if quality not in ImageProcessor.BG_QUALITY_MODES:
+            raise ValueError(f"Unknown background removal quality: {quality}")
+
+        rgb = image.convert("RGB")
+        source = rgb
+        if quality == "fast" and max(rgb.size) > mask_size:
+            # The model itself only sees ~320px, so a box-filtered copy loses nothing
+            source = rgb.copy()
+            source.thumbnail((mask_size, mask_size), Image.BOX)
+
+        with span("segment", quality=quality, size=f"{source.width}x{source.height}"):
+            if session is None:
+                with ImageProcessor.session_pool.acquire() as pooled:
+                    mask = pooled.predict(source)[0]
+            else:
+                mask = session.predict(source)[0]
+        if mask.size != rgb.size:
+            mask = mask.resize(rgb.size, mask_resample)
+
+        alpha = mask
+        if quality == "matting":
+            # Enable alpha matting and lower the foreground threshold so internal pixels aren't dropped
+            from rembg.bg import alpha_matting_cutout
+            try:
+                with span("matting"):
+                    alpha = alpha_matting_cutout(
+                        rgb,
+                        mask,
+                        foreground_threshold=200,   # lower = more pixels kept
+                        background_threshold=10,
+                        erode_structure_size=3
+                    ).getchannel("A")
+            except ValueError:
+                # Matting can fail on degenerate trimaps; fall back to the raw mask
+                pass
+
+        result = image.convert("RGBA")
+        if "A" in image.getbands() or "transparency" in image.info:
+            # Keep what was already transparent, e.g. when re-running on a cutout
+            alpha = ImageChops.multiply(result.getchannel("A"), alpha.convert("L"))
+        result.putalpha(alpha)
+        return result
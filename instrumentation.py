@@ -0,0 +1,178 @@
+"""
+Lightweight per-stage latency and memory instrumentation
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def rss_bytes():
+    """Resident memory of this process in bytes, or None where it can't be read cheaply"""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Tracer:
+    """Records how long each stage takes and how much memory it adds.
+
+    Every span is kept in a rolling window per stage for percentile
+    summaries. Once enable() is given a path, spans are also appended to it
+    as JSON lines through one open handle (spans from worker processes land
+    in the same file); when it grows past max_bytes it is renamed to
+    `path`.1 and a new file started. Memory deltas are process-wide
+    resident-size changes, so with concurrent work they are indicative
+    rather than exact.
+    """
+
+    def __init__(self, path=None, window=200, max_bytes=10 * 1024 * 1024):
+        self.path = None
+        self.window = window
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._file = None
+        self._size = 0
+        if path:
+            self.enable(path)
+
+    def enable(self, path):
+        """Append spans to path from now on; None, "", "0" or "off" turns the log off"""
+        if path and path.lower() in ("0", "off"):
+            path = None
+        with self._lock:
+            self._close()
+            self.path = path or None
+            if self.path:
+                try:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._open()
+                except OSError:
+                    self.path = None
+        return self.path
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _open(self):
+        # Line buffered, so each span reaches the file in one write and nothing
+        # is lost if the process exits without closing the tracer
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+        self._size = os.fstat(self._file.fileno()).st_size
+
+    def _close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _rotate(self):
+        try:
+            current = os.stat(self.path)
+            # Another process sharing the log may have rotated it already
+            if os.path.samestat(current, os.fstat(self._file.fileno())) and current.st_size >= self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+        except OSError:
+            pass
+        self._close()
+        self._open()
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """Time the enclosed block as one occurrence of stage"""
+        rss_before = rss_bytes()
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            rss_after = rss_bytes()
+            delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+            self.record(stage, seconds, delta, error=error, **fields)
+
+    def record(self, stage, seconds, memory_delta=None, **fields):
+        entry = {"ts": round(time.time(), 3), "stage": stage, "ms": round(seconds * 1000, 2),
+                 "rss_delta_mb": None if memory_delta is None else round(memory_delta / (1024 * 1024), 2),
+                 "pid": os.getpid()}
+        entry.update((k, v) for k, v in fields.items() if v is not None)
+        with self._lock:
+            self._durations.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            if self._file is not None:
+                line = json.dumps(entry) + "\n"  # ASCII only, so len() is the byte count
+                try:
+                    self._file.write(line)
+                    self._size += len(line)
+                    if self.max_bytes and self._size >= self.max_bytes:
+                        self._rotate()
+                except (OSError, ValueError):
+                    pass  # instrumentation must never break the work it measures
+
+    def percentiles(self, stage):
+        """(p50, p95, count) in seconds over the rolling window, or None if unseen"""
+        with self._lock:
+            durations = sorted(self._durations.get(stage, ()))
+        if not durations:
+            return None
+        return (durations[len(durations) // 2],
+                durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                len(durations))
+
+    def describe(self, stages):
+        """One-line p50/p95 summary of the given stages for the status bar"""
+        parts = []
+        for stage in stages:
+            stats = self.percentiles(stage)
+            if stats:
+                parts.append(f"{stage} {_format(stats[0])}/{_format(stats[1])}")
+        return ("p50/p95: " + " | ".join(parts)) if parts else ""
+
+
+def _format(seconds):
+    return f"{seconds:.1f}s" if seconds >= 1 else f"{seconds * 1000:.0f}ms"
+
+
+tracer = Tracer()
+span = tracer.span
+
+
+def timed(stage):
+    """Decorator recording each call of the wrapped function as a span"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,136 @@
+"""
+Bounded-concurrency priority queue for image generation jobs
+"""
+
+import itertools
+import queue
+import threading
+import time
+
+# Lower numbers run first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class GenerationJob:
+    """A single queued generation request and its lifecycle state"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, job_id, prompt, run, priority):
+        self.job_id = job_id
+        self.prompt = prompt
+        self.run = run
+        self.priority = priority
+        self.status = GenerationJob.QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        """Seconds spent running, or None if the job never started"""
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class GenerationJobQueue:
+    """Runs generation jobs on a fixed number of worker threads.
+
+    ``on_update(job)`` is called from the worker threads whenever a job
+    changes state; GUI callers should marshal it onto their own thread.
+    Cancelling a running job cannot abort the underlying API call, but its
+    result is discarded when it returns.
+    """
+
+    def __init__(self, max_concurrency=2, on_update=None):
+        self.max_concurrency = max_concurrency
+        self.on_update = on_update
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._jobs = {}  # job_id -> job, for jobs that are queued or running
+        self._workers = []
+        for i in range(max_concurrency):
+            worker = threading.Thread(target=self._work, name=f"generation-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, prompt, run, priority=PRIORITY_INTERACTIVE):
+        """Queue run() for execution and return its GenerationJob"""
+        job = GenerationJob(next(self._ids), prompt, run, priority)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._queue.put((priority, next(self._seq), job))
+        self._notify(job)
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it already finished"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return False
+            job.status = GenerationJob.CANCELLED
+            job.finished_at = time.monotonic()
+        self._notify(job)
+        return True
+
+    def cancel_all(self):
+        """Cancel every queued and running job"""
+        with self._lock:
+            job_ids = list(self._jobs)
+        return sum(1 for job_id in job_ids if self.cancel(job_id))
+
+    def counts(self):
+        """Return (running, queued) job counts"""
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.status == GenerationJob.RUNNING)
+            return running, len(self._jobs) - running
+
+    def shutdown(self):
+        """Cancel outstanding work and stop the workers"""
+        self.cancel_all()
+        for _ in self._workers:
+            self._queue.put((float("inf"), next(self._seq), None))
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.status != GenerationJob.QUEUED:
+                    continue  # cancelled while waiting
+                job.status = GenerationJob.RUNNING
+                job.started_at = time.monotonic()
+            self._notify(job)
+
+            try:
+                result, error = job.run(), None
+            except Exception as e:
+                result, error = None, str(e)
+
+            with self._lock:
+                if self._jobs.pop(job.job_id, None) is None:
+                    continue  # cancelled while running; drop the result
+                job.finished_at = time.monotonic()
+                job.result = result
+                job.error = error
+                job.status = GenerationJob.FAILED if error else GenerationJob.DONE
+            self._notify(job)
+
+    def _notify(self, job):
+        if self.on_update:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                print(f"Error reporting job status: {e}")
@@ -0,0 +1,48 @@
+"""
+Module to setup the Library tab: search indexed images and open them.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+
+def setup_library_tab(parent, app):
+    """Create and pack the asset library UI into the given parent frame."""
+    library_frame = ttk.LabelFrame(parent, text="Asset Library", padding="10")
+    library_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+
+    # Search box; results update as you type
+    search_frame = ttk.Frame(library_frame)
+    search_frame.pack(fill=tk.X)
+    ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+    app.library_query = tk.StringVar()
+    search_entry = ttk.Entry(search_frame, textvariable=app.library_query)
+    search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 5))
+    search_entry.bind("<KeyRelease>", lambda event: app.schedule_library_search())
+    ttk.Button(search_frame, text="Rescan", command=app.rescan_library).pack(side=tk.RIGHT)
+
+    # Thumbnails with prompt and size; double-click opens the image
+    style = ttk.Style(parent)
+    style.configure("Library.Treeview", rowheight=app.library.thumbnail_size // 2 + 8)
+    tree_frame = ttk.Frame(library_frame)
+    tree_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+    scrollbar = ttk.Scrollbar(tree_frame, orient="vertical")
+    scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    app.library_tree = ttk.Treeview(tree_frame, columns=("prompt", "size"), style="Library.Treeview",
+                                    yscrollcommand=scrollbar.set, selectmode="browse")
+    app.library_tree.heading("#0", text="")
+    app.library_tree.column("#0", width=app.library.thumbnail_size // 2 + 24, stretch=False)
+    app.library_tree.heading("prompt", text="Prompt")
+    app.library_tree.column("prompt", width=200)
+    app.library_tree.heading("size", text="Size")
+    app.library_tree.column("size", width=80, stretch=False)
+    app.library_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    scrollbar.config(command=app.library_tree.yview)
+    app.library_tree.bind("<Double-1>", lambda event: app.open_library_asset())
+    app.library_tree.bind("<<TreeviewSelect>>", lambda event: app.show_library_details())
+
+    # Details of the selected asset: template, parameters, edit chain
+    app.library_details = tk.StringVar()
+    ttk.Label(library_frame, textvariable=app.library_details, wraplength=300, justify=tk.LEFT,
+              font=("", 8)).pack(fill=tk.X, pady=(5, 0))
+    app.library_status = tk.StringVar(value="Indexing...")
+    ttk.Label(library_frame, textvariable=app.library_status, foreground='gray').pack(anchor=tk.W, pady=(5, 0))
@@ -2,21 +2,32 @@
 Main GUI application for AI Image Generator
 """
 
+import time
+STARTED = time.perf_counter()  # startup is measured from here (see benchmarks/bench_startup.py)
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
 from PIL import Image, ImageTk
 import threading
 import os
 from datetime import datetime
-import win32clipboard
-import win32con
 from io import BytesIO
 import json
 
-from image_generator import ImageGenerator
 from image_processor import ImageProcessor
+from asset_library import AssetLibrary, describe_edits
+from asset_metadata import read_metadata
+from processing_pipeline import ProcessingPipeline
+from process_pool import ImageWorkerPool
+from edit_history import EditHistory
+from display_cache import DisplayCache
+from frame_scheduler import FrameScheduler
+from instrumentation import span, tracer
+from edit_graph import EditGraph, RenderCache, ImageOp, RegionOp, ContrastOp, BrightnessOp
+from job_queue import GenerationJobQueue, GenerationJob, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
 from edit_tab import setup_edit_tab
 from generate_tab import setup_generate_tab
+from library_tab import setup_library_tab
 
 class ImageGeneratorApp:    
     
@@ -30,20 +41,47 @@ class ImageGeneratorApp:
         self.image_generator = None
         self.current_image = None
         self.current_photo = None
-        self.edit_history = []  # stack for undo
+        # Scaled previews of recently shown images
+        self.display_cache = DisplayCache()
+        self.displayed = None  # (id(image), fit box) currently drawn
+        # Cached checkerboard shown behind transparent images
+        self.background_photo = None
+        self.background_size = (0, 0)
+        self.background_job = None
+        # Compressed undo/redo snapshots, bounded by EDIT_HISTORY_MB
+        self.edit_history = EditHistory(max_bytes=int(os.getenv("EDIT_HISTORY_MB", "256")) * 1024 * 1024)
+        # Full-size renders kept for instant undo/redo, bounded by EDIT_RENDER_CACHE_MB
+        self.render_cache_bytes = int(os.getenv("EDIT_RENDER_CACHE_MB", "256")) * 1024 * 1024
+        # Edits on the current base image, recorded as ops and rendered lazily
+        self.edit_graph = None
+        # A new edit still rendering; it only becomes edit_graph once shown
+        self.pending_graph = None
         # Selection state
         self.selection_rect = None
-        self.selection_anim = None
         self.selection_offset = 0
         self.selection_coords = None  # (x0, y0, x1, y1)
+        self.selection_region = None  # selected pixel box in the image; None = whole image
+        self.image_rect = None  # canvas rectangle the image is drawn in
+        self.drag_anchor = None
         
         # User preferences
         self.auto_remove_bg = tk.BooleanVar(value=True)
+        self.force_fresh = tk.BooleanVar(value=False)
+        self.bg_quality = tk.StringVar(value="fast")
+        self.palette_choice = tk.StringVar(value="pico-8")
         self.template_file = "prompt_template.txt"
         
         # Create output directory
         self.output_dir = "generated_images"
         os.makedirs(self.output_dir, exist_ok=True)
+        # Searchable index of everything saved under the output directory
+        self.library = AssetLibrary(self.output_dir)
+        self.library_assets = {}  # tree item -> asset shown in the Library tab
+        self.library_thumbs = []  # keeps the tree's PhotoImages alive
+        self.library_search_job = None
+        # Prompt, template, parameters and earlier edits of the current base image
+        self.asset_info = {}
+        self.job_assets = {}  # job id -> asset info for its result
         
         # Default prompt template text
         self.default_template_text = (
@@ -51,8 +89,45 @@ class ImageGeneratorApp:
             "not on any sort of platform, but floating on a white background"
         )
         
+        # Per-stage timings are logged to LATENCY_LOG ("off" to disable);
+        # enabled before the worker processes start so they log there too
+        tracer.enable(os.getenv("LATENCY_LOG", os.path.join("generated_images", "timings.jsonl")))
+        # CPU-heavy operations (background removal, quantize) run in worker
+        # processes so they never compete with Tk for the GIL; 0 keeps them in-process
+        self.workers = ImageWorkerPool(processes=int(os.getenv("IMAGE_WORKER_PROCESSES", "2")))
+        # Heavy image operations run here so the window never freezes; one
+        # thread per worker process lets their jobs overlap
+        self.processing = ProcessingPipeline(self.root, max_workers=max(1, self.workers.processes))
+        # Generation requests are queued so several can be in flight at once
+        self.job_queue = GenerationJobQueue(max_concurrency=2, on_update=self.on_job_update)
+        self.progress_running = False
+        # All canvas redraws and the selection animation run through one frame loop
+        self.frames = FrameScheduler(self.root, on_stats=self.show_frame_stats)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
         self.setup_ui()
+        # The API client and the background removal model load after the
+        # window is on screen so they don't delay the first frame
+        self.generator_loading = True
+        self.root.after(0, self.start_background_services)
+    
+    def start_background_services(self):
+        """Finish startup once the window is up: API client, model warm-up"""
+        # Flush pending geometry and drawing so the first frame is really shown
+        self.root.update_idletasks()
+        self.first_frame_ms = (time.perf_counter() - STARTED) * 1000
+        if os.getenv("APP_STARTUP_BENCHMARK"):
+            # benchmarks/bench_startup.py reads this line and closes the app
+            print(f"first_frame_ms={self.first_frame_ms:.1f}", flush=True)
+            self.root.after(0, self.on_close)
+            return
         self.initialize_generator()
+        self.rescan_library()
+        # Load the background removal model while the user is typing a prompt
+        if self.workers.processes:
+            self.workers.warm_up()
+        else:
+            ImageProcessor.warm_up(background=True)
     
     def setup_ui(self):
         """Setup the user interface"""
@@ -78,12 +153,26 @@ class ImageGeneratorApp:
         self.notebook.add(edit_tab, text="Edit")
         # Delegate building of edit controls
         setup_edit_tab(edit_tab, self)
+        # Library tab: search and reopen saved images
+        library_tab = ttk.Frame(self.notebook)
+        self.notebook.add(library_tab, text="Library")
+        setup_library_tab(library_tab, self)
         
         # Status bar
         self.status_var = tk.StringVar()
         self.status_var.set("Ready")
-        status_bar = ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN)
-        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        status_bar = ttk.Label(status_frame, textvariable=self.status_var, relief=tk.SUNKEN)
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.history_var = tk.StringVar()
+        self.update_history_status()
+        ttk.Label(status_frame, textvariable=self.history_var, relief=tk.SUNKEN).pack(side=tk.RIGHT)
+        self.frame_var = tk.StringVar()
+        ttk.Label(status_frame, textvariable=self.frame_var, relief=tk.SUNKEN).pack(side=tk.RIGHT)
+        # Rolling per-stage latency (full spans go to LATENCY_LOG)
+        self.latency_var = tk.StringVar()
+        ttk.Label(status_frame, textvariable=self.latency_var, relief=tk.SUNKEN).pack(side=tk.RIGHT)
     
     def create_canvas_section(self, parent):
         """Create the main canvas section"""
@@ -93,8 +182,13 @@ class ImageGeneratorApp:
         # Canvas for displaying image
         self.canvas = tk.Canvas(canvas_frame, bg='white', width=600, height=600)
         self.canvas.pack(fill=tk.BOTH, expand=True)
-        # Redraw background on canvas resize
-        self.canvas.bind('<Configure>', lambda event: self.create_checkered_background())
+        # Redraw background on canvas resize, once the resize settles
+        self.canvas.bind('<Configure>', self.schedule_background)
+        # Drag on the image to limit edits to a region; Escape selects everything
+        self.canvas.bind('<ButtonPress-1>', self.start_selection)
+        self.canvas.bind('<B1-Motion>', self.drag_selection)
+        self.canvas.bind('<ButtonRelease-1>', self.end_selection)
+        self.root.bind('<Escape>', lambda event: self.select_all())
         
         # Create checkered background pattern
         self.create_checkered_background()
@@ -114,9 +208,8 @@ class ImageGeneratorApp:
         ttk.Button(canvas_controls, text="Copy to Clipboard", command=self.copy_to_clipboard).pack(side=tk.LEFT)
     
     def create_checkered_background(self):
-        """Create a checkered background pattern on the canvas"""
-        # Clear any existing background
-        self.canvas.delete("background")
+        """Show the checkered background as a single cached image item"""
+        self.background_job = None
         
         # Get canvas dimensions
         width = self.canvas.winfo_width()
@@ -126,44 +219,84 @@ class ImageGeneratorApp:
         if width <= 1 or height <= 1:
             width, height = 600, 600
         
-        # Checkered pattern settings
-        square_size = 20
-        color1 = "#f0f0f0"  # Light gray
-        color2 = "#e0e0e0"  # Slightly darker gray
-        
-        # Draw checkered pattern
-        for row in range(0, height // square_size + 1):
-            for col in range(0, width // square_size + 1):
-                x1 = col * square_size
-                y1 = row * square_size
-                x2 = x1 + square_size
-                y2 = y1 + square_size
-                
-                # Alternate colors
-                color = color1 if (row + col) % 2 == 0 else color2
-                
-                self.canvas.create_rectangle(
-                    x1, y1, x2, y2,
-                    fill=color,
-                    outline=color,
-                    tags="background"
-                )
+        # The pattern is only re-rendered when the canvas outgrows it; a larger
+        # pattern is simply clipped, so shrinking costs nothing
+        cached_width, cached_height = self.background_size
+        if width > cached_width or height > cached_height:
+            # Round up so a drag-resize doesn't re-render on every pixel
+            self.background_size = (max(width, cached_width) + 255) // 256 * 256, \
+                                   (max(height, cached_height) + 255) // 256 * 256
+            self.background_photo = ImageTk.PhotoImage(self.render_checkerboard(*self.background_size))
+        
+        if self.canvas.find_withtag("background"):
+            self.canvas.itemconfigure("background", image=self.background_photo)
+        else:
+            self.canvas.create_image(0, 0, anchor=tk.NW, image=self.background_photo, tags="background")
         # ensure background stays below image and selection
         self.canvas.tag_lower("background")
     
+    def schedule_background(self, event=None):
+        """Debounce <Configure>: redraw the background once resizing pauses"""
+        if self.background_job:
+            self.canvas.after_cancel(self.background_job)
+        self.background_job = self.canvas.after(100, self.on_canvas_resized)
+    
+    def on_canvas_resized(self):
+        """Redraw the background and refit the current image to the new size"""
+        self.frames.request("background", self.create_checkered_background)
+        self.frames.request("image", self.draw_image)
+    
+    def update_latency_status(self):
+        """Show rolling p50/p95 of the main pipeline stages, plus API retry/breaker trouble"""
+        text = tracer.describe(["api", "download", "remove_background", "pool_remove_background", "display",
+                                "end_to_end"])
+        if self.image_generator:
+            stats = self.image_generator.resilience_stats()
+            if stats.get("api_retries"):
+                text += f" | retries {stats['api_retries']}"
+            if stats["breaker"] != "closed":
+                text += " | API circuit open"
+        self.latency_var.set(text)
+    
+    def show_frame_stats(self, stats):
+        """Show recent canvas frame times in the status bar"""
+        self.frame_var.set(f"Frame: {stats['mean_ms']:.1f} ms avg, {stats['p95_ms']:.1f} ms p95")
+    
+    @staticmethod
+    def render_checkerboard(width, height, square_size=20):
+        """Render the light/dark grey checker pattern as an RGB image"""
+        cols = width // square_size + 1
+        rows = height // square_size + 1
+        # One pixel per square, then a nearest-neighbour scale up
+        parity = bytes((row + col) % 2 for row in range(rows) for col in range(cols))
+        pattern = Image.frombytes("P", (cols, rows), parity)
+        pattern.putpalette([0xf0, 0xf0, 0xf0, 0xe0, 0xe0, 0xe0])  # light gray, slightly darker gray
+        pattern = pattern.resize((cols * square_size, rows * square_size), Image.NEAREST)
+        return pattern.crop((0, 0, width, height)).convert("RGB")
+    
     # Generate controls have been moved to generate_tab.setup_generate_tab
     
 
     # Edit controls have been moved to edit_tab.setup_edit_tab
     
     def initialize_generator(self):
-        """Initialize the image generator"""
-        try:
-            self.image_generator = ImageGenerator()
+        """Initialize the image generator in the background (importing openai is slow)"""
+        def create():
+            from image_generator import ImageGenerator
+            return ImageGenerator()
+        
+        def on_done(generator):
+            self.image_generator = generator
+            self.generator_loading = False
             self.status_var.set("AI Generator initialized successfully")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to initialize AI generator: {str(e)}")
+        
+        def on_error(message):
+            self.generator_loading = False
+            messagebox.showerror("Error", f"Failed to initialize AI generator: {message}")
             self.status_var.set("Error: AI Generator not available")
+        
+        self.status_var.set("Starting AI Generator...")
+        self.processing.submit(create, on_done, on_error, channel="startup")
     
     def add_to_chat(self, message, sender="System"):
         """Add message to chat history"""
@@ -181,68 +314,94 @@ class ImageGeneratorApp:
             return enhanced_prompt
         return base_prompt
     
+    def get_prompts(self):
+        """Get one templated prompt per non-empty line of the entry widget"""
+        template = self.prompt_template.get("1.0", tk.END).strip()
+        lines = [line.strip() for line in self.prompt_entry.get("1.0", tk.END).splitlines()]
+        return [template.replace("{prompt}", line) for line in lines if line]
+    
     def clear_prompt(self):
         """Clear the prompt entry"""
         self.prompt_entry.delete("1.0", tk.END)
     
     def display_image(self, image):
-        """Display image on canvas"""
+        """Make image current and draw it on the canvas in the next frame"""
+        if image:
+            self.current_image = image
+            # Several updates in one event-loop turn collapse into a single draw
+            self.frames.request("image", self.draw_image)
+    
+    def draw_image(self):
+        """Draw the current image on the canvas"""
+        image = self.current_image
         if image:
             # Resize image to fit canvas if needed
             canvas_width = self.canvas.winfo_width()
             canvas_height = self.canvas.winfo_height()
             
             if canvas_width > 1 and canvas_height > 1:  # Canvas is initialized
-                display_image = image.copy()
-                display_image.thumbnail((canvas_width - 20, canvas_height - 20), Image.NEAREST)
+                box = (canvas_width - 20, canvas_height - 20)
+                # Nothing changed since the last draw: keep the canvas as it is
+                if self.displayed == (id(image), box) and self.canvas.find_withtag("image"):
+                    return
                 
-                self.current_photo = ImageTk.PhotoImage(display_image)
-                # remove only previous image, keep background and selection
-                self.canvas.delete("image")
-                # draw new image and tag it
-                self.canvas.create_image(
-                    canvas_width // 2,
-                    canvas_height // 2,
-                    anchor=tk.CENTER,
-                    image=self.current_photo,
-                    tags="image"
-                )
-                # update current image and default selection to full image area
-                # update current image and default selection to full image area
-                self.current_image = image
-                x0 = canvas_width//2 - display_image.width//2
-                y0 = canvas_height//2 - display_image.height//2
-                x1 = x0 + display_image.width
-                y1 = y0 + display_image.height
-                self.set_selection((x0, y0, x1, y1))
+                with span("display", size=f"{image.width}x{image.height}"):
+                    self.current_photo = self.display_cache.photo(image, box)
+                    self.displayed = (id(image), box)
+                    # remove only previous image, keep background and selection
+                    self.canvas.delete("image")
+                    # draw new image and tag it
+                    self.canvas.create_image(
+                        canvas_width // 2,
+                        canvas_height // 2,
+                        anchor=tk.CENTER,
+                        image=self.current_photo,
+                        tags="image"
+                    )
+                x0 = canvas_width//2 - self.current_photo.width()//2
+                y0 = canvas_height//2 - self.current_photo.height()//2
+                x1 = x0 + self.current_photo.width()
+                y1 = y0 + self.current_photo.height()
+                self.image_rect = (x0, y0, x1, y1)
+                # keep a region selection across edits, otherwise select the full image
+                region = self.selection_region
+                if region and region[2] <= image.width and region[3] <= image.height:
+                    self.set_selection(self.image_to_canvas_box(region))
+                else:
+                    self.selection_region = None
+                    self.set_selection(self.image_rect)
     
     def generate_image(self):
-        """Generate new image from prompt"""
-        prompt = self.get_prompt()
-        if not prompt:
+        """Queue a new image generation for each prompt line"""
+        prompts = self.get_prompts()
+        if not prompts:
             messagebox.showwarning("Warning", "Please enter a prompt")
             return
         
         if not self.image_generator:
-            messagebox.showerror("Error", "AI Generator not available")
+            if self.generator_loading:
+                self.status_var.set("AI Generator is still starting, please try again in a moment")
+            else:
+                messagebox.showerror("Error", "AI Generator not available")
             return
         
-        self.add_to_chat(f"Generating: {prompt}", "User")
-        self.generate_btn.configure(state='disabled')
-        self.progress.start()
-        self.status_var.set("Generating image...")
-        
-        def generate_thread():
-            try:
-                image = self.image_generator.generate_image(prompt)
-                self.root.after(0, lambda: self.on_generation_complete(image, "Image generated successfully!"))
-            except Exception as e:
-                self.root.after(0, lambda: self.on_generation_error(str(e)))
-        
-        threading.Thread(target=generate_thread, daemon=True).start()
+        force_refresh = self.force_fresh.get()
+        template = self.prompt_template.get("1.0", tk.END).strip()
+        lines = [line.strip() for line in self.prompt_entry.get("1.0", tk.END).splitlines() if line.strip()]
+        # A single prompt is interactive; several lines form a background batch
+        priority = PRIORITY_INTERACTIVE if len(prompts) == 1 else PRIORITY_BACKGROUND
+        for line, prompt in zip(lines, prompts):
+            job = self.job_queue.submit(
+                prompt,
+                lambda prompt=prompt: self.image_generator.generate_image(prompt, force_refresh=force_refresh),
+                priority,
+            )
+            self.job_assets[job.job_id] = self.generation_asset(line, template)
+            self.add_to_chat(f"Job #{job.job_id} generating: {prompt}", "User")
+        self.clear_prompt()
     
     def modify_image(self):
-        """Modify current image"""
+        """Queue a modification of the current image"""
         if not self.current_image:
             messagebox.showwarning("Warning", "No image to modify. Generate an image first.")
             return
@@ -252,41 +411,116 @@ class ImageGeneratorApp:
             messagebox.showwarning("Warning", "Please enter a modification prompt")
             return
         
-        self.add_to_chat(f"Modifying with: {prompt}", "User")
-        self.modify_btn.configure(state='disabled')
-        self.progress.start()
-        self.status_var.set("Modifying image...")
-        
-        def modify_thread():
-            try:
-                image = self.image_generator.modify_image(self.current_image, prompt)
-                self.root.after(0, lambda: self.on_generation_complete(image, "Image modified successfully!"))
-            except Exception as e:
-                self.root.after(0, lambda: self.on_generation_error(str(e)))
+        if not self.image_generator:
+            if self.generator_loading:
+                self.status_var.set("AI Generator is still starting, please try again in a moment")
+            else:
+                messagebox.showerror("Error", "AI Generator not available")
+            return
         
-        threading.Thread(target=modify_thread, daemon=True).start()
+        force_refresh = self.force_fresh.get()
+        current = self.current_image
+        job = self.job_queue.submit(
+            prompt,
+            lambda: self.image_generator.modify_image(current, prompt, force_refresh=force_refresh),
+        )
+        self.job_assets[job.job_id] = self.generation_asset(
+            self.prompt_entry.get("1.0", tk.END).strip(), self.prompt_template.get("1.0", tk.END).strip(),
+            modified=True)
+        self.add_to_chat(f"Job #{job.job_id} modifying with: {prompt}", "User")
+        self.clear_prompt()
     
-    def on_generation_complete(self, image, message):
+    def generation_asset(self, prompt, template, **params):
+        """Asset info recorded with a generated image when it is saved"""
+        generator = self.image_generator
+        params.update(model=generator.model, quality=generator.quality, size="1024x1024")
+        return {"prompt": prompt, "template": template, "params": params, "edits": []}
+    
+    def on_job_update(self, job):
+        """Called from generation workers; forward the status change to the Tk thread"""
+        status = job.status
+        self.root.after(0, lambda: self.show_job_status(job, status))
+    
+    def show_job_status(self, job, status):
+        """Report a job state change in the chat panel and status bar"""
+        if status == GenerationJob.RUNNING:
+            self.add_to_chat(f"Job #{job.job_id} started", "System")
+        elif status == GenerationJob.CANCELLED:
+            self.job_assets.pop(job.job_id, None)
+            self.add_to_chat(f"Job #{job.job_id} cancelled", "System")
+        elif status == GenerationJob.DONE:
+            self.on_generation_complete(
+                job.result,
+                f"Job #{job.job_id} finished in {job.elapsed:.1f}s",
+                channel=f"job-{job.job_id}",
+                submitted_at=job.submitted_at,
+                asset=self.job_assets.pop(job.job_id, None),
+            )
+        elif status == GenerationJob.FAILED:
+            self.job_assets.pop(job.job_id, None)
+            self.on_generation_error(
+                f"Job #{job.job_id}: {job.error}",
+                show_dialog=job.priority == PRIORITY_INTERACTIVE,
+            )
+            self.update_latency_status()
+        
+        running, queued = self.job_queue.counts()
+        if running or queued:
+            self.jobs_var.set(f"Jobs: {running} running, {queued} queued")
+            if not self.progress_running:
+                self.progress.start()
+                self.progress_running = True
+        else:
+            self.jobs_var.set("Jobs: idle")
+            if self.progress_running:
+                self.progress.stop()
+                self.progress_running = False
+    
+    def cancel_jobs(self):
+        """Cancel all queued and running generation jobs"""
+        cancelled = self.job_queue.cancel_all()
+        self.status_var.set(f"Cancelled {cancelled} job(s)")
+    
+    def on_generation_complete(self, image, message, channel="canvas", submitted_at=None, asset=None):
         """Handle successful image generation"""
+        def displayed():
+            # Runs in the frame after the image is drawn: prompt to pixels on screen
+            tracer.record("end_to_end", time.monotonic() - submitted_at)
+            self.update_latency_status()
+        
+        def finish(result):
+            # Supersede any edit still running against the previous image
+            self.processing.cancel()
+            # Keep the replaced image reachable through undo
+            if self.current_image is not None:
+                self.edit_history.push(self.current_image)
+            self.set_base_image(result, asset)
+            self.add_to_chat(message, "System")
+            stats = self.image_generator.cache.stats()
+            self.status_var.set(f"Ready (cache: {stats['hits']} hits, {stats['misses']} misses)")
+            if submitted_at is not None:
+                self.frames.request("end_to_end", displayed)
+        
         # Automatically remove background from generated images if enabled
         if self.auto_remove_bg.get():
-            image = ImageProcessor.remove_background(image)
-        
-        self.display_image(image)
-        self.add_to_chat(message, "System")
-        self.clear_prompt()
-        self.generate_btn.configure(state='normal')
-        self.modify_btn.configure(state='normal')
-        self.progress.stop()
-        self.status_var.set("Ready")
+            quality = self.bg_quality.get()
+            if asset is not None:
+                asset["edits"].append({"op": "remove_background", "quality": quality})
+            self.status_var.set("Removing background...")
+            self.processing.submit(
+                lambda: self.workers.run("remove_background", image, quality=quality),
+                finish,
+                self.on_generation_error,
+                channel=channel,
+            )
+        else:
+            finish(image)
     
-    def on_generation_error(self, error_message):
+    def on_generation_error(self, error_message, show_dialog=True):
         """Handle image generation error"""
         self.add_to_chat(f"Error: {error_message}", "System")
-        messagebox.showerror("Generation Error", error_message)
-        self.generate_btn.configure(state='normal')
-        self.modify_btn.configure(state='normal')
-        self.progress.stop()
+        if show_dialog:
+            messagebox.showerror("Generation Error", error_message)
         self.status_var.set("Error occurred")
     
     def save_image(self):
@@ -302,9 +536,13 @@ class ImageGeneratorApp:
         )
         
         if filename:
-            if ImageProcessor.save_image(self.current_image, filename):
+            metadata = dict(self.asset_info, created=time.time())
+            metadata["edits"] = self.asset_info.get("edits", []) + (
+                self.edit_graph.describe() if self.edit_graph else [])
+            if ImageProcessor.save_image(self.current_image, filename, metadata):
                 self.add_to_chat(f"Image saved to: {filename}", "System")
                 self.status_var.set("Image saved successfully")
+                self.run_library_task(lambda: self.library.index_file(filename, metadata))
             else:
                 messagebox.showerror("Error", "Failed to save image")
     
@@ -317,7 +555,8 @@ class ImageGeneratorApp:
         if filename:
             image = ImageProcessor.load_image(filename)
             if image:
-                self.display_image(image)
+                self.processing.cancel()
+                self.set_base_image(image, read_metadata(image))
                 self.add_to_chat(f"Image loaded from: {filename}", "System")
                 self.status_var.set("Image loaded successfully")
             else:
@@ -325,16 +564,27 @@ class ImageGeneratorApp:
     
     def clear_canvas(self):
         """Clear the canvas"""
+        self.processing.cancel()
         self.canvas.delete("all")
         self.current_image = None
         self.current_photo = None
+        self.displayed = None
+        self.display_cache.clear()
+        self.edit_graph = None
+        self.pending_graph = None
+        self.asset_info = {}
+        self.update_history_status()
         self.add_to_chat("Canvas cleared", "System")
         self.status_var.set("Canvas cleared")
         # clear any selection
-        if hasattr(self, 'selection_anim') and self.selection_anim:
-            self.canvas.after_cancel(self.selection_anim)
+        self.frames.stop("image")
+        self.frames.stop("selection")
         self.canvas.delete('selection')
+        self.selection_rect = None
         self.selection_coords = None
+        self.selection_region = None
+        self.image_rect = None
+        self.frames.request("background", self.create_checkered_background)
     
     def apply_more_pixelation(self):
         """Apply more pixelation to current image"""
@@ -342,11 +592,8 @@ class ImageGeneratorApp:
             messagebox.showwarning("Warning", "No image to pixelate")
             return
         
-        # save state for undo
-        self.edit_history.append(self.current_image.copy())
-        pixelated = ImageProcessor.pixelate(self.current_image, pixel_size=12)
-        self.display_image(pixelated)
-        self.add_to_chat("Applied more pixelation", "System")
+        self.run_edit(ImageOp("pixelate", lambda image: ImageProcessor.pixelate(image, pixel_size=12), pixel_size=12),
+                      "Applied more pixelation")
     
     def apply_less_pixelation(self):
         """Apply less pixelation to current image"""
@@ -354,11 +601,19 @@ class ImageGeneratorApp:
             messagebox.showwarning("Warning", "No image to pixelate")
             return
         
-        # save state for undo
-        self.edit_history.append(self.current_image.copy())
-        pixelated = ImageProcessor.pixelate(self.current_image, pixel_size=4)
-        self.display_image(pixelated)
-        self.add_to_chat("Applied less pixelation", "System")
+        self.run_edit(ImageOp("pixelate", lambda image: ImageProcessor.pixelate(image, pixel_size=4), pixel_size=4),
+                      "Applied less pixelation")
+    
+    def apply_palette(self):
+        """Reduce the current image to the selected 8-bit palette"""
+        if not self.current_image:
+            messagebox.showwarning("Warning", "No image to modify")
+            return
+        
+        palette = self.palette_choice.get()
+        self.run_edit(ImageOp("quantize", lambda image: self.workers.run("quantize", image, palette=palette),
+                              palette=palette),
+                      f"Applied {palette} palette", scoped=False)
     
     def copy_to_clipboard(self):
         """Copy current image to clipboard as DIB for Windows"""
@@ -372,6 +627,9 @@ class ImageGeneratorApp:
         data = output.getvalue()[14:]
         # Set clipboard data
         try:
+            # pywin32 is only needed (and only available) for the Windows clipboard
+            import win32clipboard
+            import win32con
             win32clipboard.OpenClipboard()
             win32clipboard.EmptyClipboard()
             win32clipboard.SetClipboardData(win32con.CF_DIB, data)
@@ -387,11 +645,7 @@ class ImageGeneratorApp:
             messagebox.showwarning("Warning", "No image to modify")
             return
         
-        # save state for undo
-        self.edit_history.append(self.current_image.copy())
-        enhanced = ImageProcessor.adjust_contrast(self.current_image, 1.3)
-        self.display_image(enhanced)
-        self.add_to_chat("Increased contrast", "System")
+        self.run_edit(ContrastOp(1.3), "Increased contrast")
     
     def increase_brightness(self):
         """Increase image brightness"""
@@ -399,11 +653,7 @@ class ImageGeneratorApp:
             messagebox.showwarning("Warning", "No image to modify")
             return
         
-        # save state for undo
-        self.edit_history.append(self.current_image.copy())
-        enhanced = ImageProcessor.adjust_brightness(self.current_image, 1.2)
-        self.display_image(enhanced)
-        self.add_to_chat("Increased brightness", "System")
+        self.run_edit(BrightnessOp(1.2), "Increased brightness")
     
     def resize_image(self):
         """Resize current image"""
@@ -416,13 +666,15 @@ class ImageGeneratorApp:
         if new_size:
             try:
                 width, height = map(int, new_size.split(','))
-                # save state for undo
-                self.edit_history.append(self.current_image.copy())
-                resized = ImageProcessor.resize_image(self.current_image, (width, height), maintain_aspect=False)
-                self.display_image(resized)
-                self.add_to_chat(f"Resized to {width}x{height}", "System")
             except ValueError:
                 messagebox.showerror("Error", "Invalid size format. Use 'width,height'")
+                return
+            self.run_edit(
+                ImageOp("resize", lambda image: ImageProcessor.resize_image(image, (width, height), maintain_aspect=False),
+                        width=width, height=height),
+                f"Resized to {width}x{height}",
+                scoped=False
+            )
     
     def remove_background(self):
         """Remove background from current image"""
@@ -430,54 +682,215 @@ class ImageGeneratorApp:
             messagebox.showwarning("Warning", "No image to process")
             return
         
-        # save state for undo
-        self.edit_history.append(self.current_image.copy())
+        quality = self.bg_quality.get()
         # Use the background removal method from ImageProcessor
-        processed = ImageProcessor.remove_background(self.current_image)
-        self.display_image(processed)
-        self.add_to_chat("Background removed", "System")
+        self.run_edit(
+            ImageOp("remove_background", lambda image: self.workers.run("remove_background", image, quality=quality),
+                    expensive=True, quality=quality),
+            "Background removed"
+        )
+
+    def set_base_image(self, image, asset=None):
+        """Show a new image with an empty edit chain on top of it.
+        
+        asset describes where the image came from (prompt, parameters, earlier
+        edits) and is saved with it; None when that is unknown.
+        """
+        self.edit_graph = self.new_edit_graph(image)
+        self.pending_graph = None
+        self.asset_info = asset or {}
+        self.selection_region = None
+        self.display_image(image)
+        self.update_history_status()
+
+    def new_edit_graph(self, image):
+        """An empty edit graph on image with its own bounded render cache"""
+        return EditGraph(image, renders=RenderCache(max_bytes=self.render_cache_bytes))
+
+    def update_history_status(self):
+        """Show pending edit count and undo/render memory use in the status bar"""
+        edits = len(self.edit_graph.ops) if self.edit_graph else 0
+        renders = self.edit_graph.cached_bytes() / (1024 * 1024) if self.edit_graph else 0
+        self.history_var.set(f"Edits: {edits} | {self.edit_history.describe()} | Renders: {renders:.1f} MB")
+
+    def show_graph(self, graph, message, status, on_commit=None):
+        """Render graph on the processing worker and make it current once shown"""
+        def on_done(result):
+            self.edit_graph = graph
+            self.pending_graph = None
+            if on_commit:
+                on_commit()
+            self.display_image(result)
+            self.update_history_status()
+            self.update_latency_status()
+            self.add_to_chat(message, "System")
+            self.status_var.set(status)
+        
+        def render():
+            with span("render", ops=len(graph.ops)):
+                return graph.render()
+        
+        def on_error(error_message):
+            self.pending_graph = None
+            self.add_to_chat(f"Error: {error_message}", "System")
+            self.status_var.set("Error occurred")
+        
+        # States seen recently (typically undo/redo) are already rendered
+        rendered = graph.rendered()
+        if rendered is not None:
+            on_done(rendered)
+            return
+        self.pending_graph = graph if graph is not self.edit_graph else None
+        self.processing.submit(render, on_done, on_error)
+
+    def cancel_pending_edit(self):
+        """Drop a new edit that is still rendering; True if there was one.
+
+        Undo/redo call this first so one click only ever takes back the edit
+        still in flight, never that one plus the edit already shown.
+        """
+        if self.pending_graph is None or not self.processing.is_busy():
+            self.pending_graph = None
+            return False
+        self.processing.cancel()
+        self.pending_graph = None
+        self.add_to_chat("Cancelled edit in progress", "System")
+        self.status_var.set("Edit cancelled")
+        return True
+
+    def run_edit(self, op, message, scoped=True):
+        """Record op on the current image's edit graph and render the result.
+        
+        Scoped edits only touch the selected region when there is one.
+        """
+        if self.processing.is_busy():
+            self.status_var.set("Still processing, please wait...")
+            return
+        if self.edit_graph is None:
+            self.edit_graph = self.new_edit_graph(self.current_image)
+        if scoped and self.selection_region:
+            op = RegionOp(op, self.selection_region)
+            message += " to selection"
+        self.status_var.set("Processing...")
+        # A new edit starts a new branch, so older undone images can't be redone
+        self.show_graph(self.edit_graph.append(op), message, "Ready", on_commit=self.edit_history.discard_redo)
 
     def undo_edit(self):
         """Undo the last image edit"""
-        if not self.edit_history:
+        if self.cancel_pending_edit():
+            return
+        # Drop any other work still in flight; its result would land on top of the undo
+        self.processing.cancel()
+        if self.edit_graph is not None and self.edit_graph.can_undo():
+            # Undoing an edit just drops its op from the chain; commit right away
+            # so repeated clicks keep stepping back while the render catches up
+            self.edit_graph = self.edit_graph.undo()
+            self.show_graph(self.edit_graph, "Undo edit", "Undo performed")
+        elif self.edit_history.can_undo():
+            # Step back to the image this one replaced
+            previous = self.edit_history.undo(self.current_image)
+            self.set_base_image(previous)
+            self.add_to_chat("Undo edit", "System")
+            self.status_var.set("Undo performed")
+        else:
             messagebox.showinfo("Info", "Nothing to undo")
+    
+    def redo_edit(self):
+        """Redo the last undone image edit"""
+        if self.cancel_pending_edit():
             return
-        previous = self.edit_history.pop()
-        self.display_image(previous)
-        self.add_to_chat("Undo edit", "System")
-        self.status_var.set("Undo performed")
+        self.processing.cancel()
+        if self.edit_graph is not None and self.edit_graph.can_redo():
+            self.edit_graph = self.edit_graph.redo()
+            self.show_graph(self.edit_graph, "Redo edit", "Redo performed")
+        elif self.edit_history.can_redo():
+            following = self.edit_history.redo(self.current_image)
+            self.set_base_image(following)
+            self.add_to_chat("Redo edit", "System")
+            self.status_var.set("Redo performed")
+        else:
+            messagebox.showinfo("Info", "Nothing to redo")
     
     def set_selection(self, coords):
         """Set and start animating the selection rectangle."""
         # coords: (x0, y0, x1, y1) in canvas coordinates
         self.selection_coords = coords
-        # reset selection animation
-        if self.selection_anim:
-            self.canvas.after_cancel(self.selection_anim)
-        self.selection_offset = 0
         # remove existing selection
         self.canvas.delete('selection')
-        # draw new selection rectangle with dash pattern
+        # draw new selection rectangle with dash pattern, above the image
         x0, y0, x1, y1 = coords
         self.selection_rect = self.canvas.create_rectangle(
             x0, y0, x1, y1,
             outline='black', dash=(4,2), tags='selection'
         )
+        self.canvas.tag_raise('selection')
         # start marching-ants animation by updating dashoffset
         self.selection_offset = 0
-        self.selection_anim = self.canvas.after(50, self.animate_selection)
+        self.frames.animate('selection', self.animate_selection)
+    
+    def canvas_to_image_box(self, coords):
+        """Map a canvas rectangle to a pixel box in the current image, clamped to it"""
+        x0, y0, x1, y1 = self.image_rect
+        width, height = self.current_image.size
+        scale_x = width / (x1 - x0)
+        scale_y = height / (y1 - y0)
+        left, right = sorted((coords[0], coords[2]))
+        top, bottom = sorted((coords[1], coords[3]))
+        return (min(max(round((left - x0) * scale_x), 0), width),
+                min(max(round((top - y0) * scale_y), 0), height),
+                min(max(round((right - x0) * scale_x), 0), width),
+                min(max(round((bottom - y0) * scale_y), 0), height))
+    
+    def image_to_canvas_box(self, box):
+        """Map a pixel box in the current image to canvas coordinates"""
+        x0, y0, x1, y1 = self.image_rect
+        width, height = self.current_image.size
+        scale_x = (x1 - x0) / width
+        scale_y = (y1 - y0) / height
+        return (x0 + round(box[0] * scale_x), y0 + round(box[1] * scale_y),
+                x0 + round(box[2] * scale_x), y0 + round(box[3] * scale_y))
+    
+    def start_selection(self, event):
+        """Begin dragging out a selection on the image"""
+        if not self.current_image or not self.image_rect:
+            return
+        x0, y0, x1, y1 = self.image_rect
+        self.drag_anchor = (min(max(event.x, x0), x1), min(max(event.y, y0), y1))
+    
+    def drag_selection(self, event):
+        if not self.drag_anchor:
+            return
+        x0, y0, x1, y1 = self.image_rect
+        x, y = min(max(event.x, x0), x1), min(max(event.y, y0), y1)
+        self.set_selection((min(self.drag_anchor[0], x), min(self.drag_anchor[1], y),
+                            max(self.drag_anchor[0], x), max(self.drag_anchor[1], y)))
+    
+    def end_selection(self, event):
+        """Turn the dragged rectangle into the image region that edits apply to"""
+        if not self.drag_anchor:
+            return
+        self.drag_anchor = None
+        region = self.canvas_to_image_box(self.selection_coords)
+        if region[2] - region[0] < 2 or region[3] - region[1] < 2 or region == (0, 0) + self.current_image.size:
+            # A click (or a drag covering everything) selects the whole image
+            self.select_all()
+            return
+        self.selection_region = region
+        self.status_var.set(f"Selected {region[2] - region[0]}x{region[3] - region[1]} at ({region[0]}, {region[1]})")
+    
+    def select_all(self):
+        """Reset the selection so edits apply to the whole image"""
+        self.selection_region = None
+        if self.image_rect:
+            self.set_selection(self.image_rect)
     
     def animate_selection(self):
         """Animate the marching ants effect by updating dash offset."""
-        if not getattr(self, 'selection_rect', None):
+        if not self.selection_rect:
             return
         # increment dashoffset for continuous marching effect
         self.selection_offset = (self.selection_offset + 1) % 16
         self.canvas.itemconfig(self.selection_rect, dashoffset=self.selection_offset)
-        # ensure selection stays on top
-        self.canvas.tag_raise('selection')
-        # schedule next frame
-        self.selection_anim = self.canvas.after(50, self.animate_selection)
     
     def load_prompt_template(self):
         """Load the prompt template from file if it exists"""
@@ -508,6 +921,97 @@ class ImageGeneratorApp:
             self.status_var.set("Error saving template")
             return False
 
+    def run_library_task(self, task):
+        """Run a library update on its own thread, then refresh the Library tab"""
+        def run():
+            try:
+                task()
+            except Exception as e:
+                message = str(e)
+                self.root.after(0, lambda: self.library_status.set(f"Indexing failed: {message}"))
+                return
+            self.root.after(0, self.search_library)
+        threading.Thread(target=run, name="asset-library", daemon=True).start()
+    
+    def rescan_library(self):
+        """Index new, changed and deleted files under the output directory"""
+        def progress(count):
+            self.root.after(0, lambda: self.library_status.set(f"Indexing... {count} files"))
+        self.library_status.set("Indexing...")
+        self.run_library_task(lambda: self.library.index_directory(on_progress=progress))
+    
+    def schedule_library_search(self):
+        """Search once typing pauses instead of on every keystroke"""
+        if self.library_search_job is not None:
+            self.root.after_cancel(self.library_search_job)
+        self.library_search_job = self.root.after(150, self.search_library)
+    
+    def search_library(self):
+        """Show the assets matching the Library tab's search box"""
+        self.library_search_job = None
+        started = time.perf_counter()
+        assets = self.library.search(self.library_query.get(), limit=200)
+        elapsed = (time.perf_counter() - started) * 1000
+        
+        self.library_tree.delete(*self.library_tree.get_children())
+        self.library_assets.clear()
+        self.library_thumbs = []
+        self.library_details.set("")
+        for asset in assets:
+            thumb = self.library.thumbnail(asset)
+            photo = None
+            if thumb is not None:
+                thumb.thumbnail((self.library.thumbnail_size // 2, self.library.thumbnail_size // 2))
+                photo = ImageTk.PhotoImage(thumb)
+                self.library_thumbs.append(photo)
+            prompt = asset["prompt"] or os.path.basename(asset["path"])
+            item = self.library_tree.insert("", tk.END, image=photo if photo else "",
+                                            values=(prompt, f"{asset['width']}x{asset['height']}"))
+            self.library_assets[item] = asset
+        self.library_status.set(f"{len(assets)} shown of {self.library.count()} assets ({elapsed:.0f} ms)")
+    
+    def show_library_details(self):
+        """Describe the selected asset under the results list"""
+        selection = self.library_tree.selection()
+        asset = self.library_assets.get(selection[0]) if selection else None
+        if asset is None:
+            self.library_details.set("")
+            return
+        params = ", ".join(f"{key}={value}" for key, value in sorted(asset["params"].items()))
+        lines = [asset["path"]]
+        if asset["template"]:
+            lines.append(f"Template: {asset['template']}")
+        if params:
+            lines.append(f"Parameters: {params}")
+        if asset["edits"]:
+            lines.append(f"Edits: {describe_edits(asset['edits'])}")
+        self.library_details.set("\n".join(lines))
+    
+    def open_library_asset(self):
+        """Load the selected asset onto the canvas"""
+        selection = self.library_tree.selection()
+        asset = self.library_assets.get(selection[0]) if selection else None
+        if asset is None:
+            return
+        image = ImageProcessor.load_image(asset["path"])
+        if image is None:
+            messagebox.showerror("Error", "Failed to load image (was it moved? try Rescan)")
+            return
+        self.processing.cancel()
+        if self.current_image is not None:
+            self.edit_history.push(self.current_image)
+        self.set_base_image(image, read_metadata(image))
+        self.add_to_chat(f"Image loaded from library: {asset['path']}", "System")
+        self.status_var.set("Image loaded successfully")
+    
+    def on_close(self):
+        """Stop background work and close the window"""
+        self.job_queue.shutdown()
+        self.processing.shutdown()
+        self.workers.shutdown()
+        tracer.close()
+        self.root.destroy()
+
 def main():
     root = tk.Tk()
     app = ImageGeneratorApp(root)
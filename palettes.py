@@ -0,0 +1,119 @@
+"""
+Colour palettes and fast nearest-colour lookup for palette quantization
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+
+def _hex_colors(*codes):
+    return [tuple(int(code[i:i + 2], 16) for i in (0, 2, 4)) for code in codes]
+
+
+PALETTES = {
+    "pico-8": _hex_colors(
+        "000000", "1D2B53", "7E2553", "008751", "AB5236", "5F574F", "C2C3C7", "FFF1E8",
+        "FF004D", "FFA300", "FFEC27", "00E436", "29ADFF", "83769C", "FF77A8", "FFCCAA",
+    ),
+    "nes": _hex_colors(
+        "7C7C7C", "0000FC", "0000BC", "4428BC", "940084", "A80020", "A81000", "881400",
+        "503000", "007800", "006800", "005800", "004058", "000000",
+        "BCBCBC", "0078F8", "0058F8", "6844FC", "D800CC", "E40058", "F83800", "E45C10",
+        "AC7C00", "00B800", "00A800", "00A844", "008888",
+        "F8F8F8", "3CBCFC", "6888FC", "9878F8", "F878F8", "F85898", "F87858", "FCA044",
+        "F8B800", "B8F818", "58D854", "58F898", "00E8D8", "787878",
+        "FCFCFC", "A4E4FC", "B8B8F8", "D8B8F8", "F8B8F8", "F8A4C0", "F0D0B0", "FCE0A8",
+        "F8D878", "D8F878", "B8F8B8", "B8F8D8", "00FCFC", "F8D8F8",
+    ),
+    "game-boy": _hex_colors("0F380F", "306230", "8BAC0F", "9BBC0F"),
+}
+
+# Bits per channel of the lookup table; 6 bits = 64^3 cells, finer than the
+# gaps between colours in any of the fixed palettes
+LUT_BITS = 6
+
+
+def parse_palette(spec):
+    """Turn a palette name, hex strings or RGB tuples into a (n, 3) uint8 array"""
+    if isinstance(spec, str):
+        try:
+            colors = PALETTES[spec.lower()]
+        except KeyError:
+            raise ValueError(f"Unknown palette: {spec}")
+    else:
+        colors = [_hex_colors(c.lstrip("#"))[0] if isinstance(c, str) else tuple(c) for c in spec]
+    palette = np.array(colors, dtype=np.uint8).reshape(-1, 3)
+    if not 1 <= len(palette) <= 255:
+        raise ValueError("A palette needs between 1 and 255 colours")
+    return palette
+
+
+@lru_cache(maxsize=16)
+def _lut_for(palette_bytes):
+    palette = np.frombuffer(palette_bytes, dtype=np.uint8).reshape(-1, 3).astype(np.float32)
+    step = 1 << (8 - LUT_BITS)
+    levels = np.arange(1 << LUT_BITS, dtype=np.float32) * step + step / 2  # cell centres
+    r, g, b = np.meshgrid(levels, levels, levels, indexing="ij")
+    cells = np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)
+    # |c - p|^2 = |c|^2 - 2 c.p + |p|^2, and |c|^2 doesn't change the argmin,
+    # so the whole search is one matrix product per chunk
+    palette_norms = (palette ** 2).sum(axis=1)
+    lut = np.empty(len(cells), dtype=np.uint8)
+    for start in range(0, len(cells), 32768):
+        distance = palette_norms - 2 * (cells[start:start + 32768] @ palette.T)
+        lut[start:start + 32768] = distance.argmin(axis=1)
+    return lut
+
+
+def nearest_color_lut(palette):
+    """Precomputed table mapping every quantized RGB cell to its nearest palette index.
+
+    Built once per palette (tens of milliseconds) and cached, so each image
+    lookup is a single vectorized gather.
+    """
+    return _lut_for(np.ascontiguousarray(palette, dtype=np.uint8).tobytes())
+
+
+def map_to_palette(rgb, palette):
+    """Return the palette index of each pixel in an (..., 3) uint8 array"""
+    shift = 8 - LUT_BITS
+    cells = ((rgb[..., 0].astype(np.uint32) >> shift) << (2 * LUT_BITS)) \
+        | ((rgb[..., 1].astype(np.uint32) >> shift) << LUT_BITS) \
+        | (rgb[..., 2].astype(np.uint32) >> shift)
+    return nearest_color_lut(palette)[cells]
+
+
+def kmeans_palette(rgb, colors=16, iterations=8, sample_size=20000, seed=0):
+    """Fit an adaptive palette to an (n, 3) array of pixels with k-means.
+
+    Runs on a random sample with k-means++ seeding, which is plenty to place
+    16-32 colours and keeps the fit in the tens of milliseconds.
+    """
+    rng = np.random.default_rng(seed)
+    pixels = np.asarray(rgb, dtype=np.float32).reshape(-1, 3)
+    if len(pixels) == 0:
+        raise ValueError("No pixels to build a palette from")
+    if len(pixels) > sample_size:
+        pixels = pixels[rng.choice(len(pixels), sample_size, replace=False)]
+
+    centers = [pixels[rng.integers(len(pixels))]]
+    closest = ((pixels - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, colors):
+        total = closest.sum()
+        if total == 0:
+            break  # fewer distinct colours than requested
+        centers.append(pixels[np.searchsorted(np.cumsum(closest), rng.random() * total)])
+        closest = np.minimum(closest, ((pixels - centers[-1]) ** 2).sum(axis=1))
+    centers = np.array(centers)
+
+    for _ in range(iterations):
+        # Same argmin as the full squared distance, as one matrix product
+        labels = ((centers ** 2).sum(axis=1) - 2 * (pixels @ centers.T)).argmin(axis=1)
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.stack([np.bincount(labels, weights=pixels[:, c], minlength=len(centers))
+                         for c in range(3)], axis=1)
+        moved = counts > 0
+        centers[moved] = sums[moved] / counts[moved, None]
+
+    return np.clip(np.rint(centers), 0, 255).astype(np.uint8)
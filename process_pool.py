@@ -0,0 +1,148 @@
+"""
+Process pool for CPU-heavy image operations, exchanging pixels via shared memory
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+from PIL import Image
+
+from instrumentation import span, tracer
+
+# Operations a worker may run; each returns an image the same size as its input
+OPERATIONS = ("remove_background", "quantize", "pixelate", "adjust_contrast", "adjust_brightness")
+
+# Enough to keep background removal off the GUI thread without each worker's
+# model competing for every core; callers wanting more pass processes explicitly
+DEFAULT_PROCESSES = 2
+
+# Modes whose raw bytes are copied as-is; anything else is converted to RGBA first
+RAW_MODES = {"L": 1, "LA": 2, "P": 1, "RGB": 3, "RGBA": 4}
+
+
+def _worker_init(warm_up, threads, log_path):
+    from image_processor import ImageProcessor
+
+    tracer.enable(log_path)
+
+    # Split the cores between the workers instead of letting every worker's
+    # ONNX session start one thread per core
+    ImageProcessor.session_pool.threads = threads
+    if warm_up:
+        ImageProcessor.warm_up(background=False)
+
+
+def _run_in_worker(operation, in_name, out_name, mode, size, palette, info, kwargs):
+    from image_processor import ImageProcessor
+
+    # Workers share the parent's resource tracker, so attaching here does not
+    # take ownership; the parent unlinks both blocks when the job finishes
+    source = shared_memory.SharedMemory(name=in_name)
+    target = shared_memory.SharedMemory(name=out_name)
+    try:
+        view = source.buf[:size[0] * size[1] * RAW_MODES[mode]]
+        image = Image.frombytes(mode, size, view)
+        view.release()
+        if palette is not None:
+            image.putpalette(palette)
+        image.info.update(info)
+
+        result = getattr(ImageProcessor, operation)(image, **kwargs)
+        if result.mode not in RAW_MODES:
+            result = result.convert("RGBA")
+        if result.size != image.size:
+            raise ValueError(f"{operation} changed the image size")
+        data = result.tobytes()
+        target.buf[:len(data)] = data
+        return (result.mode, result.size,
+                result.getpalette() if result.mode == "P" else None,
+                {k: v for k, v in result.info.items() if k == "transparency"})
+    finally:
+        source.close()
+        target.close()
+
+
+class ImageWorkerPool:
+    """Runs ImageProcessor operations in separate processes.
+
+    Pixel data travels through shared memory blocks owned by the calling
+    process (one for the input, one sized for an RGBA result), so only a
+    few bytes of metadata are pickled per job and the GUI process does not
+    hold the GIL while the work runs. run() blocks, so call it from a worker
+    thread such as the processing pipeline; several threads may call it at
+    once to keep all processes busy. With processes=0 everything runs in
+    the calling process instead.
+    """
+
+    def __init__(self, processes=DEFAULT_PROCESSES, warm_up=True):
+        self.processes = processes
+        self.warm_up_workers = warm_up
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            # Forking a process that has onnxruntime's thread pools running can
+            # deadlock the child, so always start clean interpreters
+            self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=get_context("spawn"),
+                                                 initializer=_worker_init,
+                                                 initargs=(self.warm_up_workers, self.threads_per_worker(),
+                                                           tracer.path))
+        return self._executor
+
+    def threads_per_worker(self):
+        """ONNX Runtime threads each worker's rembg session may use"""
+        return max(1, (os.cpu_count() or 1) // max(1, self.processes))
+
+    def warm_up(self):
+        """Start the worker processes now (each loads the rembg model once)"""
+        if self.processes > 0:
+            for _ in range(self.processes):
+                self._pool().submit(int)
+
+    def run(self, operation, image, **kwargs):
+        """Return ImageProcessor.<operation>(image, **kwargs) computed in a worker"""
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unsupported worker operation: {operation}")
+        if self.processes <= 0:
+            from image_processor import ImageProcessor
+            return getattr(ImageProcessor, operation)(image, **kwargs)
+
+        # Its own stage, since the worker already records the operation itself;
+        # this one adds the shared-memory copies and the round trip
+        with span("pool_" + operation):
+            return self._run_in_pool(operation, image, kwargs)
+
+    def _run_in_pool(self, operation, image, kwargs):
+        if image.mode not in RAW_MODES:
+            image = image.convert("RGBA")
+        width, height = image.size
+        source = shared_memory.SharedMemory(create=True, size=max(1, width * height * RAW_MODES[image.mode]))
+        target = shared_memory.SharedMemory(create=True, size=max(1, width * height * 4))
+        try:
+            data = image.tobytes()
+            source.buf[:len(data)] = data
+            del data
+            palette = image.getpalette() if image.mode == "P" else None
+            info = {k: v for k, v in image.info.items() if k == "transparency"}
+            mode, size, palette, info = self._pool().submit(
+                _run_in_worker, operation, source.name, target.name, image.mode, image.size,
+                palette, info, kwargs).result()
+
+            view = target.buf[:size[0] * size[1] * RAW_MODES[mode]]
+            result = Image.frombytes(mode, size, view)
+            view.release()
+            if palette is not None:
+                result.putpalette(palette)
+            result.info.update(info)
+            return result
+        finally:
+            source.close()
+            source.unlink()
+            target.close()
+            target.unlink()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,82 @@
+"""
+Background processing stage that keeps image work off the Tk main thread
+"""
+
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ProcessingPipeline:
+    """Runs image operations in a worker executor and posts results back to Tk.
+
+    Jobs are submitted on a named channel. Submitting a new job on a channel
+    supersedes the previous one: it is cancelled if it has not started yet,
+    and its result is discarded if it has. Callbacks always run on the Tk
+    thread via ``root.after``, so they may touch widgets freely.
+    """
+
+    def __init__(self, root, max_workers=1):
+        self.root = root
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-processing")
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._latest = {}   # channel -> id of the job whose result we still want
+        self._futures = {}  # channel -> future of that job
+
+    def submit(self, operation, on_done, on_error=None, channel="canvas"):
+        """Run operation() in the background and call on_done(result) on the Tk thread"""
+        job_id = next(self._ids)
+
+        def run():
+            if not self._is_current(channel, job_id):
+                return
+            try:
+                result = operation()
+            except Exception as e:
+                if on_error:
+                    message = str(e)
+                    self.root.after(0, lambda: self._deliver(channel, job_id, on_error, message))
+                return
+            self.root.after(0, lambda: self._deliver(channel, job_id, on_done, result))
+
+        with self._lock:
+            previous = self._futures.get(channel)
+            if previous is not None:
+                previous.cancel()
+            self._latest[channel] = job_id
+            self._futures[channel] = self._executor.submit(run)
+        return job_id
+
+    def cancel(self, channel="canvas"):
+        """Cancel the pending job on channel and drop its result if it is already running"""
+        with self._lock:
+            future = self._futures.pop(channel, None)
+            self._latest.pop(channel, None)
+        if future is not None:
+            future.cancel()
+
+    def is_busy(self, channel="canvas"):
+        """True while a job on channel has not delivered its result yet"""
+        with self._lock:
+            return channel in self._latest
+
+    def shutdown(self):
+        """Stop accepting work and drop anything still queued"""
+        with self._lock:
+            self._latest.clear()
+            self._futures.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _is_current(self, channel, job_id):
+        with self._lock:
+            return self._latest.get(channel) == job_id
+
+    def _deliver(self, channel, job_id, callback, value):
+        # Runs on the Tk thread; a newer job may have superseded this one meanwhile
+        with self._lock:
+            if self._latest.get(channel) != job_id:
+                return
+            del self._latest[channel]
+            self._futures.pop(channel, None)
+        callback(value)
@@ -0,0 +1,75 @@
+"""
+Rate limiting helpers for the image generation API
+"""
+
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """Asyncio token bucket that spaces requests to a requests-per-minute budget.
+
+    ``burst`` is the number of requests that may go out back to back after
+    an idle period; the default of 1 spreads requests evenly, which is what
+    Azure's short-window quota enforcement expects. ``pause`` empties the
+    bucket and blocks every waiter, e.g. after a 429 with Retry-After.
+    """
+
+    def __init__(self, requests_per_minute, burst=1):
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        # Holding the lock while sleeping keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for the given number of seconds"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+def retry_after_seconds(headers):
+    """Parse Retry-After (or Azure's retry-after-ms) into seconds, or None"""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,83 @@
+"""
+Long-lived rembg sessions shared across background-removal calls
+"""
+
+import threading
+from contextlib import contextmanager
+
+from PIL import Image
+
+# Model the app was tuned against; newer rembg releases default to a different one
+DEFAULT_MODEL = "u2net"
+
+
+class RembgSessionPool:
+    """Thread-safe pool of rembg sessions.
+
+    Creating a session loads the ONNX model, which takes seconds, so sessions
+    are created lazily (at most ``size`` of them) and handed out to callers
+    one at a time via ``acquire``. ``threads`` caps the ONNX Runtime threads
+    each session uses for one inference (None lets it use every core).
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, size=1, threads=None):
+        self.model_name = model_name
+        self.size = max(1, size)
+        self.threads = threads
+        self._idle = []
+        self._created = 0
+        # Notified when a session is returned or a creation attempt fails, so
+        # waiters re-check whether they can take one or create one themselves
+        self._available = threading.Condition()
+
+    @contextmanager
+    def acquire(self):
+        """Borrow a session for the duration of the with-block"""
+        with self._available:
+            while not self._idle and self._created >= self.size:
+                # Pool is at capacity; wait for another caller to give one back
+                self._available.wait()
+            session = self._idle.pop() if self._idle else None
+            if session is None:
+                self._created += 1
+        if session is None:
+            try:
+                # rembg pulls in onnxruntime and takes over a second to import,
+                # so it is only loaded once a session is actually needed
+                from rembg import new_session
+                session = new_session(self.model_name, sess_opts=self._session_options())
+            except BaseException:
+                with self._available:
+                    self._created -= 1
+                    self._available.notify()
+                raise
+        try:
+            yield session
+        finally:
+            with self._available:
+                self._idle.append(session)
+                self._available.notify()
+
+    def _session_options(self):
+        if not self.threads:
+            return None
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        return options
+
+    def warm_up(self, background=True):
+        """Load the model and run a tiny inference ahead of the first real call"""
+        def _warm():
+            try:
+                with self.acquire() as session:
+                    session.predict(Image.new("RGB", (64, 64), "white"))
+            except Exception as e:
+                print(f"Error warming up background removal: {e}")
+
+        if not background:
+            _warm()
+            return None
+        thread = threading.Thread(target=_warm, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,287 @@
+"""
+Timeouts, retries, hedged requests and circuit breaking for image API calls
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import openai
+import requests
+
+from rate_limiter import retry_after_seconds
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The overall deadline of a call ran out before it could succeed"""
+
+
+def is_transient(error):
+    """True for failures worth retrying: throttling, 5xx, timeouts and dropped connections"""
+    # APITimeoutError is a subclass of APIConnectionError
+    if isinstance(error, (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409) or error.status_code >= 500
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else 0
+        return status in (408, 429) or status >= 500
+    if isinstance(error, DeadlineExceeded):
+        return False
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError))
+
+
+def _is_timeout(error):
+    return isinstance(error, (openai.APITimeoutError, requests.Timeout, TimeoutError))
+
+
+def _is_throttled(error):
+    if isinstance(error, openai.RateLimitError):
+        return True
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) == 429
+
+
+def backoff_delay(attempt, error=None, cap=60.0):
+    """Seconds to wait before retrying after `attempt` failed attempts.
+
+    The server's Retry-After (or retry-after-ms) wins when present;
+    otherwise exponential backoff with jitter so concurrent callers spread out.
+    """
+    response = getattr(error, "response", None)
+    delay = retry_after_seconds(getattr(response, "headers", None))
+    if delay is not None:
+        return delay
+    return min(cap, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+class Counters:
+    """Thread-safe named counters, read with snapshot() for monitoring"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class CircuitBreaker:
+    """Fails fast while the endpoint looks down.
+
+    After `failure_threshold` consecutive transient failures the breaker
+    opens and every call raises CircuitOpenError for `reset_timeout`
+    seconds. Then a single trial call is let through (half-open): success
+    closes the breaker, another failure opens it again. A threshold of 0
+    disables the breaker.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, counters=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.counters = counters if counters is not None else Counters()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now.
+
+        Returns True when the call is the half-open trial; if it then ends
+        without record_success/record_failure (e.g. it was cancelled), the
+        caller must release_trial() so the next call can try instead.
+        """
+        if self.failure_threshold <= 0:
+            return False
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+                if remaining > 0:
+                    self.counters.add("short_circuited")
+                    raise CircuitOpenError(f"Image API unavailable after repeated failures; "
+                                           f"retrying in {remaining:.0f}s")
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_running:
+                    self.counters.add("short_circuited")
+                    raise CircuitOpenError("Image API unavailable; waiting for a trial request")
+                self._trial_running = True
+                return True
+        return False
+
+    def release_trial(self):
+        """Free the half-open trial slot of a call that ended without an outcome, e.g. cancelled"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED
+                                                and self.failures >= self.failure_threshold > 0):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.counters.add("breaker_opened")
+
+
+class ResilientCaller:
+    """Runs blocking calls with a shared deadline, retries, hedging and a breaker.
+
+    `fn(timeout)` performs one attempt and must give up after `timeout`
+    seconds. Transient failures are retried up to max_retries times with
+    backoff_delay, as long as the wait still fits in the deadline. With
+    hedging enabled, an attempt that has not answered after `hedge_after`
+    seconds (a number, or "p95" to use the p95 of the stage's recent
+    successful attempts) is raced against one duplicate and the first
+    success wins; the loser runs on in the background until its own
+    timeout, so hedging trades extra quota for a shorter tail. Nothing is
+    hedged while the breaker is open or half-open, since the duplicate
+    would bypass it.
+    """
+
+    def __init__(self, max_retries=3, hedge_after=None, breaker=None, counters=None, window=200):
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        self.counters = counters if counters is not None else Counters()
+        self.breaker = breaker if breaker is not None else CircuitBreaker(counters=self.counters)
+        self.window = window
+        self._latencies = {}  # stage -> durations of recent successful attempts
+        self._latency_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def succeeded(self, stage="api", use_breaker=True, seconds=None):
+        """Account for one successful attempt that took `seconds` (None if untimed)"""
+        self.counters.add(f"{stage}_successes")
+        if seconds is not None:
+            with self._latency_lock:
+                self._latencies.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+        if use_breaker:
+            self.breaker.record_success()
+
+    def failed(self, error, stage="api", use_breaker=True):
+        """Account for one failed attempt; return whether it is worth retrying"""
+        transient = is_transient(error)
+        if _is_timeout(error):
+            self.counters.add(f"{stage}_timeouts")
+        if _is_throttled(error):
+            self.counters.add(f"{stage}_throttled")
+        elif transient:
+            self.counters.add(f"{stage}_transient_errors")
+        if use_breaker:
+            # Throttling and client errors prove the endpoint is up
+            if transient and not _is_throttled(error):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        return transient
+
+    def call(self, fn, deadline_at, stage="api", use_breaker=True, hedge=False):
+        """Return fn(timeout), retrying transient failures until deadline_at (time.monotonic())
+
+        Counters are prefixed with stage, e.g. api_retries or download_timeouts.
+        """
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                self.counters.add("deadline_exceeded")
+                raise DeadlineExceeded("Deadline exceeded before the request could complete")
+            trial = self.breaker.before_call() if use_breaker else False
+            self.counters.add(f"{stage}_attempts")
+            started = time.monotonic()
+            try:
+                # A duplicate would go out without asking the breaker, so only
+                # hedge while it is closed
+                hedging = hedge and (not use_breaker or self.breaker.state == CircuitBreaker.CLOSED)
+                delay = self._hedge_delay(stage) if hedging else None
+                result = fn(remaining) if delay is None else self._hedged(fn, remaining, delay)
+            except Exception as e:
+                if not self.failed(e, stage, use_breaker) or attempt >= self.max_retries:
+                    self.counters.add(f"{stage}_failures")
+                    raise
+                wait_for = backoff_delay(attempt, e)
+                if time.monotonic() + wait_for >= deadline_at:
+                    self.counters.add(f"{stage}_failures")
+                    self.counters.add("deadline_exceeded")
+                    raise
+                self.counters.add(f"{stage}_retries")
+                time.sleep(wait_for)
+                attempt += 1
+                continue
+            except BaseException:
+                # Interrupted: no verdict on the endpoint, but don't hold the trial slot
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            self.succeeded(stage, use_breaker, time.monotonic() - started)
+            return result
+
+    def _hedge_delay(self, stage):
+        if self.hedge_after == "p95":
+            with self._latency_lock:
+                durations = sorted(self._latencies.get(stage, ()))
+            # Too few samples give a meaningless p95; don't hedge blind
+            if len(durations) < 20:
+                return None
+            return durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        return self.hedge_after
+
+    def _hedged(self, fn, remaining, delay):
+        started = time.monotonic()
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+        primary = self._executor.submit(fn, remaining)
+        done, _ = wait([primary], timeout=min(delay, remaining))
+        if done:
+            return primary.result()
+        left = remaining - (time.monotonic() - started)
+        if left <= 0:
+            return primary.result()
+        self.counters.add("hedges")
+        hedge = self._executor.submit(fn, left)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.counters.add("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+def parse_hedge_after(value):
+    """AZURE_OPENAI_HEDGE_AFTER: seconds, "p95", or empty/"off" for no hedging"""
+    value = (value or "").strip().lower()
+    if value in ("", "0", "off", "none"):
+        return None
+    if value == "p95":
+        return value
+    return float(value)
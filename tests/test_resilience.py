@@ -0,0 +1,82 @@
+"""
+Circuit breaker behaviour when a half-open trial call is cancelled
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_cache import ImageCache
+from image_generator import ImageGenerator
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+
+class Interrupted(BaseException):
+    """Stands in for KeyboardInterrupt / CancelledError without stopping the test run"""
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    return breaker
+
+
+class CircuitBreakerTrialTest(unittest.TestCase):
+    def test_only_one_trial_while_half_open(self):
+        breaker = half_open_breaker()
+        self.assertTrue(breaker.before_call())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_release_trial_lets_the_next_call_try(self):
+        breaker = half_open_breaker()
+        breaker.before_call()
+        breaker.release_trial()
+        self.assertTrue(breaker.before_call())
+
+    def test_closed_breaker_calls_are_not_trials(self):
+        self.assertFalse(CircuitBreaker().before_call())
+
+    def test_interrupted_call_releases_the_trial(self):
+        breaker = half_open_breaker()
+        caller = ResilientCaller(max_retries=0, breaker=breaker)
+
+        def interrupted(timeout):
+            raise Interrupted()
+
+        with self.assertRaises(Interrupted):
+            caller.call(interrupted, time.monotonic() + 5)
+        self.assertEqual(caller.call(lambda timeout: "ok", time.monotonic() + 5), "ok")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_cancelled_batch_releases_the_trial(self):
+        async def hang(**kwargs):
+            await asyncio.Event().wait()
+
+        async def run(generator):
+            batch = generator.generate_batch(["chest"], requests_per_minute=6000, force_refresh=True)
+            task = asyncio.ensure_future(batch.__anext__())
+            await asyncio.sleep(0.05)  # the request is now in flight as the trial
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            await batch.aclose()
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            generator = ImageGenerator(cache=ImageCache(cache_dir), api_key="test", client=object(),
+                                       async_client=SimpleNamespace(images=SimpleNamespace(generate=hang)))
+            generator.breaker = generator.resilience.breaker = half_open_breaker()
+            asyncio.run(run(generator))
+            self.assertTrue(generator.breaker.before_call())
+
+
+if __name__ == "__main__":
+    unittest.main()
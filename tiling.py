@@ -0,0 +1,89 @@
+"""
+Tiled execution of image operations with bounded working memory
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+
+def tile_boxes(width, height, tile_size, align=1):
+    """Yield (left, top, right, bottom) boxes covering the image in row order.
+
+    Tile edges fall on multiples of align, so block-based operations such as
+    pixelate see the same blocks as they would on the whole image.
+    """
+    step = max(align, tile_size // align * align)
+    for top in range(0, height, step):
+        for left in range(0, width, step):
+            yield left, top, min(left + step, width), min(top + step, height)
+
+
+def _run(boxes, work, workers):
+    """Yield (box, result) in order, keeping at most 2 * workers tiles in flight"""
+    if workers <= 1:
+        for box in boxes:
+            yield box, work(box)
+        return
+    # Pillow and numpy release the GIL for the heavy lifting, so threads scale
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for box in boxes:
+            in_flight.append((box, executor.submit(work, box)))
+            if len(in_flight) >= 2 * workers:
+                box, future = in_flight.popleft()
+                yield box, future.result()
+        while in_flight:
+            box, future = in_flight.popleft()
+            yield box, future.result()
+
+
+def map_tiles(image, fn, tile_size=1024, halo=0, align=1, workers=1, mode=None):
+    """Apply fn to each tile of image and assemble the results into a new image.
+
+    fn receives a tile cropped with `halo` extra pixels on every side (clamped
+    at the image border) for neighbourhood operations, and must return an
+    image of the same size; the halo is trimmed before pasting. Besides the
+    input and output, memory use is a few tiles per worker.
+    """
+    width, height = image.size
+    output = Image.new(mode or image.mode, image.size)
+
+    def work(box):
+        left, top, right, bottom = box
+        source = (max(0, left - halo), max(0, top - halo), min(width, right + halo), min(height, bottom + halo))
+        result = fn(image.crop(source))
+        if halo:
+            offset_x, offset_y = left - source[0], top - source[1]
+            result = result.crop((offset_x, offset_y, offset_x + right - left, offset_y + bottom - top))
+        return result
+
+    for box, tile in _run(tile_boxes(width, height, tile_size, align), work, workers):
+        output.paste(tile, box[:2])
+    return output
+
+
+def resize_tiled(image, size, tile_size=1024, workers=1, resample=Image.NEAREST):
+    """Resize by rendering the output tile by tile from the matching source area.
+
+    Each output tile is resampled from its exact (fractional) source box, so
+    with NEAREST the result matches a single resize of the whole image apart
+    from the odd sample that lands on a floating-point tie between two
+    source pixels.
+    """
+    scale_x = image.width / size[0]
+    scale_y = image.height / size[1]
+
+    def work(box):
+        left, top, right, bottom = box
+        return image.resize((right - left, bottom - top), resample,
+                            box=(left * scale_x, top * scale_y, right * scale_x, bottom * scale_y))
+
+    output = Image.new(image.mode, size)
+    if image.mode == "P":
+        output.putpalette(image.getpalette())
+        output.info.update({k: v for k, v in image.info.items() if k == "transparency"})
+    for box, tile in _run(tile_boxes(size[0], size[1], tile_size), work, workers):
+        output.paste(tile, box[:2])
+    return output